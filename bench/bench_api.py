@@ -0,0 +1,243 @@
+# 🏋️‍♂️ FitGPT – bench/bench_api.py
+# ────────────────────────────────────────────────────────────────────────────
+# Offline-last mot hela appen – inga Fitbit-credentials, ingen riktig Firestore:
+# • tools.fake_fitbit (latens, kvot, 429-injektion) som FITBIT_API_BASE
+# • tools.fake_firestore i processen (FITGPT_FIRESTORE=memory) eller emulatorn
+#   om FIRESTORE_EMULATOR_HOST redan är satt
+# • uvicorn i en tråd (riktig HTTP + lifespan), samtidiga klienter via httpx
+# • p50/p95/p99 per endpoint, upstream-anrop per resurs, Firestore-operationer
+# • --json sparar resultat; --compare jämför p95 mot en baslinje (exit 1 vid regression)
+#
+# Kör:  python -m bench.bench_api [--concurrency 16] [--requests 1000] [--latency 0.05]
+#                                 [--inject-429 0.02] [--fs-latency 0.005]
+#                                 [--json out.json] [--compare baseline.json]
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date as dt_date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from tools.fake_fitbit import FakeFitbit
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_MIX = "sammanfatta=50,extended_full=15,log_meal=20,log_workout=15"
+TYPES = ["Run", "Walk", "Weights", "Bike"]
+
+
+# ─────────  Miljö + server  ─────────
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _setup_env(fake: FakeFitbit, tmp: str, args) -> None:
+    """Måste köras före `import main` – allt i main läses vid import."""
+    token = os.path.join(tmp, "fitbit_token.json")
+    with open(token, "w") as f:
+        json.dump({"access_token": "bench", "refresh_token": "bench", "expires_in": 86400,
+                   "_saved_at": time.time()}, f)
+    os.environ.update({
+        "FITBIT_API_BASE": fake.base_url,
+        "FITBIT_TOKEN_FILE": token,
+        "FITBIT_CACHE_DB": os.path.join(tmp, "fitbit_cache.sqlite3") if args.disk_cache else "",
+        "FITBIT_RATE_LIMIT": str(args.fitbit_limit),
+        "PREWARM_ENABLED": "0",
+        "SNAPSHOT_DEBOUNCE": str(args.debounce),
+    })
+    os.environ.pop("API_KEY", None)
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        os.environ["FITGPT_FIRESTORE"] = "memory"
+
+
+def _start_server(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                           log_level="warning", lifespan="on"))
+    t = threading.Thread(target=server.run, daemon=True)
+    t.start()
+    while not server.started:
+        time.sleep(0.02)
+    return server, t
+
+
+# ─────────  Last  ─────────
+def _parse_mix(spec: str) -> List[Tuple[str, int]]:
+    out = []
+    for part in spec.split(","):
+        name, w = part.split("=")
+        out.append((name.strip(), int(w)))
+    return out
+
+
+def _request(op: str, rnd: random.Random, i: int) -> Tuple[str, str, Any]:
+    today = dt_date.today()
+    d = (today - timedelta(days=rnd.randint(0, 13))).isoformat()
+    if op == "sammanfatta":
+        return "GET", f"/sammanfatta/{rnd.choice(['idag', 'igår', d])}", None
+    if op == "extended_full":
+        return "GET", "/data/extended/full?days=7", None
+    if op == "trends":
+        return "GET", f"/v1/trends?days={rnd.choice([7, 14, 28])}", None
+    if op == "log_meal":
+        return "POST", "/log/meal", {"date": d, "meal": f"bench-{i}", "items": ["havregryn", "kaffe"],
+                                     "estimated_calories": rnd.randint(200, 900)}
+    if op == "log_workout":
+        body = {"date": d, "type": rnd.choice(TYPES), "details": f"{rnd.randint(20, 60)} min"}
+        if rnd.random() < 0.5:
+            body["startTime"] = f"{d}T{rnd.randint(6, 20):02d}:{rnd.randint(0, 59):02d}:00"
+        return "POST", "/log/workout", body
+    raise ValueError(f"Okänd operation: {op}")
+
+
+async def _drive(base: str, args) -> Tuple[Dict[str, List[float]], Counter, float]:
+    mix = _parse_mix(args.mix)
+    ops, weights = [m[0] for m in mix], [m[1] for m in mix]
+    lat: Dict[str, List[float]] = {op: [] for op in ops}
+    errors: Counter = Counter()
+    counter = iter(range(args.warmup + args.requests))
+
+    async def worker(wid: int, client: httpx.AsyncClient):
+        rnd = random.Random(args.seed * 1000 + wid)
+        for i in counter:
+            op = rnd.choices(ops, weights)[0]
+            method, path, body = _request(op, rnd, i)
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, path, json=body)
+                ok = r.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            dt = time.perf_counter() - t0
+            if i < args.warmup:
+                continue
+            lat[op].append(dt)
+            if not ok:
+                errors[op] += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(w, client) for w in range(args.concurrency)))
+        wall = time.perf_counter() - t0
+    return lat, errors, wall
+
+
+# ─────────  Rapport  ─────────
+def _pct(vals: List[float], p: float) -> float:
+    if not vals:
+        return float("nan")
+    s = sorted(vals)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+
+def _summarize(lat, errors, wall, fake: FakeFitbit, db_stats, worker_stats) -> Dict[str, Any]:
+    total = sum(len(v) for v in lat.values())
+    return {
+        "requests": total,
+        "wall_s": round(wall, 3),
+        "rps": round(total / wall, 1) if wall else None,
+        "endpoints": {op: {"n": len(v), "errors": errors.get(op, 0),
+                           "p50_ms": round(_pct(v, 50) * 1000, 2),
+                           "p95_ms": round(_pct(v, 95) * 1000, 2),
+                           "p99_ms": round(_pct(v, 99) * 1000, 2),
+                           "max_ms": round(max(v) * 1000, 2) if v else None}
+                      for op, v in lat.items()},
+        "fitbit_calls": dict(fake.calls),
+        "fitbit_calls_total": sum(n for k, n in fake.calls.items() if k != "429"),
+        "firestore_ops": dict(db_stats),
+        "snapshot_worker": worker_stats,
+    }
+
+
+def _print(res: Dict[str, Any]) -> None:
+    print(f"{res['requests']} requests på {res['wall_s']} s  ({res['rps']} req/s)\n")
+    print(f"{'endpoint':16s} {'n':>6s} {'fel':>5s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s}  (ms)")
+    for op, e in res["endpoints"].items():
+        print(f"{op:16s} {e['n']:6d} {e['errors']:5d} {e['p50_ms']:9.1f} {e['p95_ms']:9.1f} "
+              f"{e['p99_ms']:9.1f} {e['max_ms'] or 0:9.1f}")
+    print(f"\nFitbit-anrop: {res['fitbit_calls_total']}  {res['fitbit_calls']}")
+    print(f"Firestore:    {res['firestore_ops']}")
+    print(f"Snapshots:    {res['snapshot_worker']}")
+
+
+def _compare(res: Dict[str, Any], baseline_path: str, max_regress: float) -> bool:
+    base = json.loads(Path(baseline_path).read_text())
+    ok = True
+    print(f"\nJämförelse mot {baseline_path} (tillåtet +{max_regress:.0%} på p95):")
+    for op, e in res["endpoints"].items():
+        b = base.get("endpoints", {}).get(op)
+        if not b or not b.get("p95_ms"):
+            continue
+        ratio = e["p95_ms"] / b["p95_ms"]
+        flag = "REGRESSION" if ratio > 1 + max_regress else "ok"
+        ok &= flag == "ok"
+        print(f"  {op:16s} p95 {b['p95_ms']:8.1f} → {e['p95_ms']:8.1f} ms  ×{ratio:4.2f}  {flag}")
+    b_calls, calls = base.get("fitbit_calls_total"), res["fitbit_calls_total"]
+    if b_calls and calls > b_calls * (1 + max_regress):
+        ok = False
+        print(f"  Fitbit-anrop {b_calls} → {calls}  REGRESSION")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline-benchmark av FitGPT-API")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--warmup", type=int, default=0, help="requests som inte räknas")
+    ap.add_argument("--mix", default=DEFAULT_MIX)
+    ap.add_argument("--latency", type=float, default=0.05, help="Fitbit-latens (s)")
+    ap.add_argument("--inject-429", type=float, default=0.0, help="andel slumpade 429:or")
+    ap.add_argument("--fitbit-limit", type=int, default=100000, help="Fitbit-kvot per timme")
+    ap.add_argument("--activities-per-day", type=int, default=4)
+    ap.add_argument("--fs-latency", type=float, default=0.0, help="latens per Firestore-op (s)")
+    ap.add_argument("--debounce", type=float, default=0.2, help="SNAPSHOT_DEBOUNCE under körningen")
+    ap.add_argument("--disk-cache", action="store_true", help="FitbitCache med SQLite (annars bara minne)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", help="spara resultat som JSON")
+    ap.add_argument("--compare", help="baslinje-JSON att jämföra mot")
+    ap.add_argument("--max-regress", type=float, default=0.25)
+    args = ap.parse_args()
+
+    os.chdir(ROOT)                                    # main monterar .well-known relativt
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeFitbit(latency=args.latency, limit=args.fitbit_limit, inject_429=args.inject_429,
+                       activities_per_day=args.activities_per_day) as fake:
+        _setup_env(fake, tmp, args)
+        sys.path.insert(0, str(ROOT))
+        import main as app_main
+        if hasattr(app_main.DB.client(), "latency"):
+            app_main.DB.client().latency = args.fs_latency
+        port = _free_port()
+        server, thread = _start_server(app_main.app, port)
+        try:
+            lat, errors, wall = asyncio.run(_drive(f"http://127.0.0.1:{port}", args))
+        finally:
+            server.should_exit = True
+            thread.join(timeout=15)
+        res = _summarize(lat, errors, wall, fake, getattr(app_main.DB.client(), "stats", {}),
+                         app_main.SNAPSHOT_WORKER.stats)
+
+    _print(res)
+    if args.json:
+        Path(args.json).write_text(json.dumps(res, indent=2, ensure_ascii=False))
+    if args.compare and not _compare(res, args.compare, args.max_regress):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# 🏋️‍♂️ FitGPT – bench/bench_merge.py
+# ────────────────────────────────────────────────────────────────────────────
+# Mikrobenchmark: workout_merge (bisect/numpy + optimal tilldelning) mot den
+# tidigare nästlade first-fit-mergen, på syntetiska dagar med hundratals aktiviteter.
+#
+# Kör:  python -m bench.bench_merge [--days 30] [--per-day 300] [--repeat 3]
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Set
+from zoneinfo import ZoneInfo
+
+from workout_merge import merge_workouts, merge_workouts_range
+
+SE_TZ = ZoneInfo("Europe/Stockholm")
+TYPES = ["Run", "Walk", "Weights", "Bike", "Swim", "Yoga"]
+
+
+# ─────────  Referens: tidigare implementation (oförändrad logik)  ─────────
+def _legacy_duration(t: str):
+    m = re.search(r"(\d+)\s*(?:min|\bmins?\b|\bm\b)", t.lower()) if t else None
+    return int(m.group(1)) if m else None
+
+
+def _legacy_guess(m: Dict[str, Any], auto_logs, used: Set[int]):
+    dur_m = _legacy_duration(m.get("details", "")) or None
+    wt_m = m.get("type", "").lower()
+    best_idx, best_score = None, 0.0
+    for idx, a in enumerate(auto_logs):
+        if idx in used:
+            continue
+        name = a.get("activityName", "").lower()
+        score = 0.0
+        if wt_m and wt_m in name:
+            score += 0.6
+        elif name and name in wt_m:
+            score += 0.4
+        dur_a = a.get("duration", 0) / 60000
+        if dur_m is not None:
+            diff = abs(dur_a - dur_m) / max(dur_a, dur_m, 1)
+            score += 0.4 if diff <= 0.05 else 0.2 if diff <= 0.15 else 0.0
+        if score > best_score:
+            best_idx, best_score = idx, score
+    return best_idx, best_score
+
+
+def legacy_merge(manual_raw, auto_raw):
+    manual = [{**w, "source": "manual"} for w in manual_raw]
+    auto = [{**a, "source": "fitbit"} for a in auto_raw]
+    merged: List[Dict[str, Any]] = []
+    used: Set[int] = set()
+    for m in manual:
+        st = m.get("start_time") or m.get("startTime")
+        if not st:
+            continue
+        try:
+            m_ts = datetime.fromisoformat(st)
+            if m_ts.tzinfo is None:
+                m_ts = m_ts.replace(tzinfo=SE_TZ)
+        except Exception:
+            merged.append(m)
+            continue
+        matched = False
+        for idx, a in enumerate(auto):
+            if idx in used:
+                continue
+            try:
+                a_ts = datetime.fromisoformat(a["originalStartTime"][:-6])
+                if a_ts.tzinfo is None:
+                    a_ts = a_ts.replace(tzinfo=SE_TZ)
+            except Exception:
+                continue
+            if abs((a_ts - m_ts).total_seconds()) < 1800:
+                used.add(idx)
+                merged.append({**a, **m, "source": "merged"})
+                matched = True
+                break
+        if not matched:
+            merged.append(m)
+    for m in [x for x in manual if not (x.get("start_time") or x.get("startTime"))]:
+        idx, conf = _legacy_guess(m, auto, used)
+        if idx is not None and conf >= 0.8:
+            used.add(idx)
+            m["start_time"] = auto[idx]["originalStartTime"][:-6]
+            merged.append({**auto[idx], **m, "source": "merged"})
+        else:
+            merged.append({**m, "needs_confirmation": True})
+    merged.extend([a for i, a in enumerate(auto) if i not in used])
+    return merged
+
+
+# ─────────  Syntetisk data  ─────────
+def synth_day(d: str, n_auto: int, rnd: random.Random):
+    day0 = datetime.fromisoformat(d)
+    auto, manual = [], []
+    for i in range(n_auto):
+        st = day0 + timedelta(seconds=rnd.randint(0, 86399))
+        dur = rnd.randint(10, 90)
+        auto.append({"logId": i, "activityName": rnd.choice(TYPES), "duration": dur * 60000,
+                     "originalStartTime": st.isoformat(timespec="milliseconds") + "+02:00"})
+        if rnd.random() < 0.3:                                 # loggat manuellt, ungefär samma tid
+            m_st = st + timedelta(minutes=rnd.randint(-25, 25))
+            manual.append({"id": f"m{i}", "date": d, "type": auto[-1]["activityName"].lower(),
+                           "details": f"{dur} min", "start_time": m_st.isoformat(timespec="seconds")})
+        elif rnd.random() < 0.05:                              # utan tid ⇒ heuristik
+            manual.append({"id": f"u{i}", "date": d, "type": auto[-1]["activityName"].lower(),
+                           "details": f"{dur} min"})
+    rnd.shuffle(auto)
+    return manual, auto
+
+
+def _matches(merged) -> int:
+    return sum(1 for w in merged if w["source"] == "merged")
+
+
+def _timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--per-day", type=int, default=300)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=7)
+    a = ap.parse_args()
+
+    rnd = random.Random(a.seed)
+    start = datetime(2025, 8, 1)
+    days = [(start + timedelta(days=i)).date().isoformat() for i in range(a.days)]
+    data = {d: synth_day(d, a.per_day, rnd) for d in days}
+    manual_by_day = {d: m for d, (m, _) in data.items()}
+    auto_by_day = {d: au for d, (_, au) in data.items()}
+    n_manual = sum(len(m) for m in manual_by_day.values())
+
+    print(f"{a.days} dagar × {a.per_day} aktiviteter, {n_manual} manuella pass")
+
+    legacy_t = _timeit(lambda: [legacy_merge(*data[d]) for d in days], a.repeat)
+    legacy_m = sum(_matches(legacy_merge(*data[d])) for d in days)
+    day_t = _timeit(lambda: [merge_workouts(*data[d], SE_TZ) for d in days], a.repeat)
+    day_m = sum(_matches(merge_workouts(*data[d], SE_TZ)) for d in days)
+    rng_t = _timeit(lambda: merge_workouts_range(manual_by_day, auto_by_day, SE_TZ,
+                                                 vectorized=True), a.repeat)
+    rng_m = sum(_matches(v) for v in
+                merge_workouts_range(manual_by_day, auto_by_day, SE_TZ, vectorized=True).values())
+
+    rows = [("legacy (nästlad first-fit)", legacy_t, legacy_m),
+            ("merge_workouts per dag (bisect)", day_t, day_m),
+            ("merge_workouts_range (numpy)", rng_t, rng_m)]
+    for name, t, m in rows:
+        print(f"{name:34s} {t * 1000:9.1f} ms  {m:5d} matchningar  ×{legacy_t / t:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# 🏋️‍♂️ FitGPT – datastore.py
+# ────────────────────────────────────────────────────────────────────────────
+# Dataåtkomst mot Firestore (måltider, pass, snapshots):
+# • select()-projektion: läs bara de fält anroparen behöver (t.ex. bara
+#   estimated_calories för kcal_in, snapshots utan fitbit-bloben)
+# • Datumintervall: EN `date >= a AND date <= b`-query per samling, grupperad per dag
+# • Snapshots via get_all (en RPC för många dokument) med field_paths
+# • Request-scope (ContextVar): samma query körs högst en gång per request –
+#   summary och pass-merge delar resultatet, och en intervall-läsning täcker
+#   dag-läsningar inom intervallet. Skrivningar i requestet invaliderar datumet.
+# • Index: se firestore.indexes.json
+
+from __future__ import annotations
+
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import span, timed
+
+Docs = List[Dict[str, Any]]
+Fields = Optional[Tuple[str, ...]]                      # None = hela dokumentet
+
+MEAL_KCAL_FIELDS: Tuple[str, ...] = ("date", "estimated_calories")
+SNAPSHOT_META = ("date", "fitbit_errors", "updated_at", "snapshot_version", "dirty")
+
+_scope: ContextVar[Optional[Dict[tuple, "asyncio.Future"]]] = ContextVar("datastore_scope", default=None)
+
+
+def begin_scope() -> Any:
+    """Startar ett request-scope; returnerar token till end_scope()."""
+    return _scope.set({})
+
+
+def end_scope(token: Any):
+    _scope.reset(token)
+
+
+def _covers(have: Fields, want: Fields) -> bool:
+    return have is None or (want is not None and set(want) <= set(have))
+
+
+def _fields(fields: Optional[Iterable[str]]) -> Fields:
+    return None if fields is None else tuple(sorted(set(fields)))
+
+
+class DataStore:
+    """Samlingarna + query-helpers. Sync-metoderna körs i trådpool, async-varianterna delas per request."""
+
+    def __init__(self, provider, prefix: str = ""):
+        """prefix: "" = toppnivå-samlingar, "users/<uid>/" = en användares partition."""
+        self._db = provider.client
+        self.prefix = prefix
+        self.meals = provider.collection(f"{prefix}meals")
+        self.workouts = provider.collection(f"{prefix}workouts")
+        self.snapshots = provider.collection(f"{prefix}daily_snapshots")
+        self.rollups = provider.collection(f"{prefix}summary_rollups")
+
+    def _col(self, name: str):
+        return {"meals": self.meals, "workouts": self.workouts}[name]
+
+    # ── Sync (Firestore-RPC) ──
+    @staticmethod
+    def _rows(q, fields: Fields) -> Iterable[Tuple[str, Dict[str, Any]]]:
+        if fields is not None:
+            q = q.select(list(fields))
+        return ((doc.id, doc.to_dict() or {}) for doc in q.stream())
+
+    def day_docs(self, name: str, d: str, fields: Fields = None) -> Docs:
+        with span(f"firestore_{name}"):
+            return [{"id": i, **data}
+                    for i, data in self._rows(self._col(name).where("date", "==", d), fields)]
+
+    @timed("firestore_range")
+    def range_docs(self, name: str, start: str, end: str, fields: Fields = None) -> Dict[str, Docs]:
+        """En enda `date in [start, end]`-query, grupperad per datum."""
+        q = self._col(name).where("date", ">=", start).where("date", "<=", end).order_by("date")
+        if fields is not None and "date" not in fields:
+            fields = fields + ("date",)
+        out: Dict[str, Docs] = {}
+        for i, data in self._rows(q, fields):
+            out.setdefault(data.get("date"), []).append({"id": i, **data})
+        return out
+
+    @timed("firestore_snapshots")
+    def read_snapshots(self, dates: List[str], paths: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        refs = [self.snapshots.document(d) for d in dates]
+        return {s.id: s.to_dict() for s in self._db().get_all(refs, field_paths=paths) if s.exists}
+
+    def read_snapshot(self, d: str, paths: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        doc = self.snapshots.document(d).get(paths)
+        return doc.to_dict() if doc.exists else None
+
+    # ── Async, delat per request ──
+    async def _shared(self, key: tuple, fn: Callable[[], Any]):
+        scope = _scope.get()
+        if scope is None:
+            return await asyncio.to_thread(fn)
+        fut = scope.get(key)
+        if fut is None:
+            fut = scope[key] = asyncio.ensure_future(asyncio.to_thread(fn))
+        return await asyncio.shield(fut)
+
+    def _from_range(self, name: str, d: str, fields: Fields):
+        for key, fut in (_scope.get() or {}).items():
+            if key[0] == "range" and key[1] == name and key[2] <= d <= key[3] and _covers(key[4], fields):
+                return fut
+        return None
+
+    async def day(self, name: str, d: str, fields: Optional[Iterable[str]] = None) -> Docs:
+        fields = _fields(fields)
+        if (fut := self._from_range(name, d, fields)) is not None:
+            return [dict(x) for x in (await asyncio.shield(fut)).get(d, [])]
+        scope = _scope.get() or {}
+        for f in (None, fields):                        # hela dokument räcker för en projektion
+            if ("day", name, d, f) in scope and _covers(f, fields):
+                fields = f
+                break
+        docs = await self._shared(("day", name, d, fields), lambda: self.day_docs(name, d, fields))
+        return [dict(x) for x in docs]
+
+    async def range(self, name: str, start: str, end: str,
+                    fields: Optional[Iterable[str]] = None) -> Dict[str, Docs]:
+        fields = _fields(fields)
+        out = await self._shared(("range", name, start, end, fields),
+                                 lambda: self.range_docs(name, start, end, fields))
+        return {d: [dict(x) for x in docs] for d, docs in out.items()}
+
+    def invalidate(self, d: str):
+        """Efter skrivning i samma request: nästa läsning av datumet går till Firestore."""
+        scope = _scope.get()
+        if scope:
+            for key in [k for k in scope if (k[0] == "day" and k[2] == d) or
+                        (k[0] == "range" and k[2] <= d <= k[3])]:
+                del scope[key]
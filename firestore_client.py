@@ -0,0 +1,111 @@
+# 🏋️‍♂️ FitGPT – firestore_client.py
+# ────────────────────────────────────────────────────────────────────────────
+# Lazy Firestore per process:
+# • google-cloud-firestore importeras och klienten byggs först vid första
+#   användning (eller i bakgrunds-warm-up från lifespan) – inte vid import av main
+# • FirestoreProvider: trådsäker engångs-init, fel sparas för /health i stället
+#   för att krascha appen när credentials saknas
+# • LazyCollection: samma API som CollectionReference, upplöses vid första anrop
+# • transactional()/server_timestamp()/increment(): samma som firestore.* men utan import-kostnad
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class FirestoreProvider:
+    """Skapar klienten via factory() en gång per process."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client: Any = None
+        self._lock = threading.Lock()
+        self.error: Optional[str] = None
+        self.init_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._client is not None
+
+    def client(self) -> Any:
+        if self._client is not None:
+            return self._client
+        with self._lock:
+            if self._client is None:
+                t0 = time.perf_counter()
+                try:
+                    self._client = self._factory()
+                    self.error = None
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                    raise
+                finally:
+                    self.init_seconds = round(time.perf_counter() - t0, 3)
+        return self._client
+
+    __call__ = client                                   # användbar direkt som Depends(DB)
+
+    def collection(self, name: str) -> "LazyCollection":
+        return LazyCollection(self, name)
+
+    async def warm(self, probe: Optional[Callable[[Any], Any]] = None) -> bool:
+        """Bygger klienten i en tråd; probe(client) öppnar t.ex. kanalen med en liten läsning."""
+        try:
+            client = await asyncio.to_thread(self.client)
+            if probe is not None:
+                await asyncio.to_thread(probe, client)
+            return True
+        except Exception as e:
+            self.error = self.error or f"{type(e).__name__}: {e}"
+            print(f"⚠️ Firestore-warm-up misslyckades: {self.error}")
+            return False
+
+    def status(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "init_s": self.init_seconds, "error": self.error}
+
+
+class LazyCollection:
+    """Proxy för db.collection(name) – inget skapas förrän ett attribut används."""
+
+    __slots__ = ("_provider", "_name", "_ref")
+
+    def __init__(self, provider: FirestoreProvider, name: str):
+        self._provider = provider
+        self._name = name
+        self._ref: Any = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._ref is None:
+            self._ref = self._provider.client().collection(self._name)
+        return getattr(self._ref, attr)
+
+    def __repr__(self) -> str:
+        return f"<LazyCollection {self._name}>"
+
+
+def transactional(fn: Callable) -> Callable:
+    """@firestore.transactional där importen sker vid första anropet."""
+    wrapped: Optional[Callable] = None
+
+    @functools.wraps(fn)
+    def call(transaction, *args, **kwargs):
+        nonlocal wrapped
+        if wrapped is None:
+            from google.cloud import firestore
+            wrapped = firestore.transactional(fn)
+        return wrapped(transaction, *args, **kwargs)
+    return call
+
+
+def server_timestamp() -> Any:
+    from google.cloud import firestore
+    return firestore.SERVER_TIMESTAMP
+
+
+def increment(n: int) -> Any:
+    from google.cloud import firestore
+    return firestore.Increment(n)
@@ -0,0 +1,142 @@
+# 🏋️‍♂️ FitGPT – fitbit_cache.py
+# ────────────────────────────────────────────────────────────────────────────
+# Tvånivå-cache för Fitbit-svar, nyckel = (resurs, datum):
+# • Nivå 1: LRU i minnet (per process)
+# • Nivå 2: SQLite på lokal disk (överlever omstart, delas mellan uvicorn-workers)
+# • TTL efter datumets ålder – gamla dagar ändras inte, idag ändras hela tiden
+# • Räknare för träffar/missar/evictions
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from datetime import date as dt_date
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cachetools import LRUCache
+
+# TTL i sekunder per datumålder (0 = idag, 1 = igår); None = ingen utgång
+TODAY_TTL     = 120
+YESTERDAY_TTL = 1800          # sömn/HRV synkas ofta in under förmiddagen
+RECENT_TTL    = 6 * 3600      # 2–3 dagar bakåt kan fortfarande efter-synkas
+IMMUTABLE_AFTER_DAYS = 3
+
+
+def ttl_for_date(d: str, today: dt_date) -> Optional[float]:
+    """TTL i sekunder för data som gäller datum d; None = ändras inte längre."""
+    age = (today - dt_date.fromisoformat(d)).days
+    if age <= 0:
+        return TODAY_TTL
+    if age == 1:
+        return YESTERDAY_TTL
+    if age < IMMUTABLE_AFTER_DAYS:
+        return RECENT_TTL
+    return None
+
+
+class _CountingLRU(LRUCache):
+    def __init__(self, maxsize: int, on_evict: Callable[[], None]):
+        super().__init__(maxsize=maxsize)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        item = super().popitem()
+        self._on_evict()
+        return item
+
+
+class FitbitCache:
+    """LRU + SQLite. Värden är JSON-serialiserbara Fitbit-blobbar ({"data": ...})."""
+
+    def __init__(self, path: Optional[str] = "fitbit_cache.sqlite3", *,
+                 maxsize: int = 1024,
+                 today: Callable[[], dt_date] = dt_date.today):
+        self._today = today
+        self.stats = {"hits_mem": 0, "hits_disk": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self._mem = _CountingLRU(maxsize, self._count_eviction)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        if path:
+            self._db = sqlite3.connect(path, timeout=2.0, check_same_thread=False,
+                                       isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS fitbit_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _count_eviction(self):
+        self.stats["evictions"] += 1
+
+    # ── Policy ──
+    def ttl_for(self, d: str) -> Optional[float]:
+        return ttl_for_date(d, self._today())
+
+    @staticmethod
+    def key(resource: str, d: str) -> str:
+        return f"{resource}|{d}"
+
+    # ── API ──
+    def get(self, resource: str, d: str) -> Optional[Dict[str, Any]]:
+        k = self.key(resource, d)
+        now = time.time()
+        with self._lock:
+            hit: Optional[Tuple[Optional[float], Dict[str, Any]]] = self._mem.get(k)
+            if hit is not None:
+                exp, val = hit
+                if exp is None or exp > now:
+                    self.stats["hits_mem"] += 1
+                    return val
+                self._mem.pop(k, None)
+                self.stats["expired"] += 1
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM fitbit_cache WHERE key = ?", (k,)
+                ).fetchone()
+                if row and (row[1] is None or row[1] > now):
+                    val = json.loads(row[0])
+                    self._mem[k] = (row[1], val)
+                    self.stats["hits_disk"] += 1
+                    return val
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, resource: str, d: str, value: Dict[str, Any]) -> None:
+        if "error" in value or value.get("stale"):
+            return
+        ttl = self.ttl_for(d)
+        exp = None if ttl is None else time.time() + ttl
+        k = self.key(resource, d)
+        with self._lock:
+            self._mem[k] = (exp, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO fitbit_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (k, json.dumps(value, separators=(",", ":")), exp),
+                )
+                self._writes += 1
+                if self._writes % 500 == 0:
+                    self._prune()
+
+    def invalidate(self, d: str) -> None:
+        """Glöm alla resurser för ett datum (t.ex. ?fresh=true)."""
+        suffix = f"|{d}"
+        with self._lock:
+            for k in [k for k in self._mem if k.endswith(suffix)]:
+                self._mem.pop(k, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM fitbit_cache WHERE key LIKE ?", (f"%{suffix}",))
+
+    def _prune(self):
+        self._db.execute("DELETE FROM fitbit_cache WHERE expires_at IS NOT NULL AND expires_at < ?",
+                         (time.time(),))
+
+    def status(self) -> Dict[str, Any]:
+        hits = self.stats["hits_mem"] + self.stats["hits_disk"]
+        total = hits + self.stats["misses"]
+        return {**self.stats, "size_mem": len(self._mem),
+                "hit_rate": round(hits / total, 3) if total else None}
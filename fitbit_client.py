@@ -0,0 +1,339 @@
+# 🏋️‍♂️ FitGPT – fitbit_client.py
+# ────────────────────────────────────────────────────────────────────────────
+# Asynkron Fitbit-klient:
+# • En poolad keep-alive-session (httpx.AsyncClient) per process
+# • Parallell fan-out av resurser via asyncio.gather
+# • Timeout per resurs + partiella fel ({"error": ...} per resurs)
+# • Intervall-hämtning: en förfrågan per resurs för hela [start, end],
+#   chunkad efter Fitbits max-intervall och uppdelad per dag
+# • Alla anrop går via RateLimitScheduler (kvot, prioritet, coalescing)
+# • Dagsblobbar cachas per (resurs, datum) i FitbitCache (minne + SQLite); dagsdelar ur
+#   intervall-svar som tappat aggregat (t.ex. sleep.summary) under en egen nyckel
+# • Latens/status per resurs till metrics (histogram, 429-räknare)
+# • Aktivitetsloggar: afterDate-cursor + pagination.next tills fönstret är täckt,
+#   sparas per dag ⇒ start-tid, merge och intervall delar samma sidor
+
+from __future__ import annotations
+
+import asyncio
+import time
+from datetime import date as dt_date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from fitbit_cache import FitbitCache
+from fitbit_scheduler import RateLimitScheduler, RateLimited
+from metrics import Counter, Histogram, record
+
+FITBIT_API_BASE = "https://api.fitbit.com/1/user/-"
+
+# Resurserna som ingår i en dags-sammanfattning (nyckel → Fitbit-sökväg)
+EXTENDED_RESOURCES: Dict[str, str] = {
+    "steps":    "activities/steps",
+    "calories": "activities/calories",
+    "sleep":    "sleep",
+    "heart":    "activities/heart",
+    "weight":   "body/log/weight",
+    "hrv":      "hrv",
+}
+
+# Sömn/HRV är långsammast hos Fitbit – ge dem lite mer tid
+DEFAULT_TIMEOUT = 6.0
+RESOURCE_TIMEOUTS: Dict[str, float] = {"sleep": 10.0, "hrv": 10.0}
+
+# Max antal dagar per förfrågan (Fitbit Web API-gränser)
+RANGE_LIMITS: Dict[str, int] = {
+    "steps":    1095,
+    "calories": 1095,
+    "sleep":    100,
+    "heart":    365,
+    "weight":   31,
+    "hrv":      30,
+}
+
+# Aktivitetsloggar: cache-nyckel, sidstorlek (Fitbits max) och säkerhetsgräns
+ACTIVITY_LOGS = "activities/list"
+ACTIVITY_PAGE_LIMIT = 100
+ACTIVITY_MAX_PAGES = 20
+
+# Fält som bär datum i listposterna (tidsserier, sömn, vikt)
+_DATE_KEYS = ("dateTime", "dateOfSleep", "date")
+
+# Cache-suffix för dagsdelar utan aggregat – ett dagsanrop får aldrig en sådan del
+RANGE_PART = "#range"
+
+FITBIT_SECONDS = Histogram("fitbit_request_seconds", "Latens mot Fitbit per resurs", ["resource"])
+FITBIT_RESPONSES = Counter("fitbit_responses_total", "Fitbit-svar per resurs och status", ["resource", "status"])
+FITBIT_429 = Counter("fitbit_rate_limited_total", "429 från Fitbit", ["resource"])
+
+TokenProvider = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def date_chunks(start: str, end: str, max_days: int) -> List[Tuple[str, str]]:
+    """Delar [start, end] i sammanhängande fönster om högst max_days dagar."""
+    s, e = dt_date.fromisoformat(start), dt_date.fromisoformat(end)
+    out: List[Tuple[str, str]] = []
+    while s <= e:
+        stop = min(s + timedelta(days=max_days - 1), e)
+        out.append((s.isoformat(), stop.isoformat()))
+        s = stop + timedelta(days=1)
+    return out
+
+
+def date_range(start: str, end: str) -> List[str]:
+    s, e = dt_date.fromisoformat(start), dt_date.fromisoformat(end)
+    return [(s + timedelta(days=i)).isoformat() for i in range((e - s).days + 1)]
+
+
+def split_by_day(blob: Dict[str, Any], dates: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Delar ett intervall-svar till {datum: {"data": {...}}} med samma form som ett dagsanrop.
+
+    Listor med datum-fält fördelas per dag; aggregat (t.ex. sleep.summary) gäller
+    hela intervallet och tas bara med när fönstret är en enda dag.
+    """
+    if "error" in blob:
+        return {d: blob for d in dates}
+    data = blob.get("data") or {}
+    out: Dict[str, Dict[str, Any]] = {d: {} for d in dates}
+    for key, val in data.items():
+        if not (isinstance(val, list) and all(isinstance(x, dict) for x in val)):
+            if len(dates) == 1:
+                out[dates[0]][key] = val
+            continue
+        for d in dates:
+            out[d][key] = []
+        for item in val:
+            d = next((str(item[k])[:10] for k in _DATE_KEYS if item.get(k)), None)
+            if d in out:
+                out[d][key].append(item)
+    return {d: {"data": v} for d, v in out.items()}
+
+
+def has_aggregates(blob: Dict[str, Any]) -> bool:
+    """Innehåller svaret fält som split_by_day bara behåller för en enda dag?"""
+    return any(not (isinstance(v, list) and all(isinstance(x, dict) for x in v))
+               for v in (blob.get("data") or {}).values())
+
+
+def new_http_client(timeout: float = DEFAULT_TIMEOUT, max_connections: int = 20) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections),
+    )
+
+
+class FitbitClient:
+    """Tunn asynkron wrapper runt Fitbits Web API med delad connection-pool."""
+
+    def __init__(self, token_provider: TokenProvider, *,
+                 base_url: str = FITBIT_API_BASE,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 max_connections: int = 20,
+                 scheduler: Optional[RateLimitScheduler] = None,
+                 cache: Optional[FitbitCache] = None,
+                 http: Optional[httpx.AsyncClient] = None):
+        """http: delad pool (flera användare, en process) – stängs då inte av aclose()."""
+        self._token_provider = token_provider
+        self.scheduler = scheduler or RateLimitScheduler()
+        self.cache = cache
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._owns_client = http is None
+        self._client = http or new_http_client(timeout, max_connections)
+
+    async def aclose(self):
+        if self._owns_client:
+            await self._client.aclose()
+
+    async def _headers(self, token: Optional[Dict[str, Any]] = None):
+        tok = token or await self._token_provider()
+        if not tok:
+            return None
+        return {"Authorization": f"Bearer {tok['access_token']}"}
+
+    async def _call(self, url: str, headers: Dict[str, str], timeout: float,
+                    resource: str = "other") -> Dict[str, Any]:
+        """Ett GET via schemaläggaren. 429 hanteras där (stale/fel), inte med sleep här."""
+        def observe(t0: float, status: Any):
+            dt = time.perf_counter() - t0
+            FITBIT_SECONDS.observe(dt, resource=resource)
+            FITBIT_RESPONSES.inc(resource=resource, status=status)
+            record("fitbit", dt)
+
+        async def once():
+            t0 = time.perf_counter()
+            try:
+                r = await self._client.get(url, headers=headers, timeout=timeout)
+            except httpx.TimeoutException:
+                observe(t0, "timeout")
+                return {"error": f"Timeout efter {timeout:.0f}s"}
+            except Exception as e:
+                observe(t0, "error")
+                return {"error": str(e)}
+            observe(t0, r.status_code)
+            self.scheduler.observe(r.headers)
+            if r.status_code == 429:
+                FITBIT_429.inc(resource=resource)
+                raise RateLimited(float(r.headers.get("Retry-After", 60)))
+            try:
+                r.raise_for_status()
+                return {"data": r.json()}
+            except Exception as e:
+                return {"error": str(e)}
+
+        return await self.scheduler.run(url, once)
+
+    def _cached(self, path: str, start: str, end: str) -> Optional[Dict[str, Any]]:
+        if self.cache is None or start != end:
+            return None
+        return self.cache.get(path, start)
+
+    async def get(self, path: str, start: str, end: str, *,
+                  timeout: Optional[float] = None,
+                  token: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Hämtar en tidsserie. Returnerar {"data": ...} eller {"error": ...}."""
+        if (hit := self._cached(path, start, end)) is not None:
+            return hit
+        h = await self._headers(token)
+        if not h:
+            return {"error": "Ingen giltig token."}
+        url = f"{self.base_url}/{path}/date/{start}/{end}.json"
+        res = await self._call(url, h, timeout or self.timeout, path)
+        if self.cache is not None and start == end:
+            self.cache.set(path, start, res)
+        return res
+
+    async def activity_logs(self, date_str: str, *,
+                            token: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """En dags aktivitetsloggar (via samma index som intervall-hämtningen)."""
+        return (await self.activity_logs_range(date_str, date_str, token=token))[date_str]
+
+    async def fetch_many(self, start: str, end: str,
+                         resources: Optional[Dict[str, str]] = None,
+                         timeouts: Optional[Dict[str, float]] = None) -> Dict[str, Dict[str, Any]]:
+        """Hämtar flera resurser parallellt. Ett fel/timeout påverkar bara sin egen nyckel."""
+        resources = resources or EXTENDED_RESOURCES
+        timeouts = {**RESOURCE_TIMEOUTS, **(timeouts or {})}
+        out = {k: hit for k in resources
+               if (hit := self._cached(resources[k], start, end)) is not None}
+        missing = [k for k in resources if k not in out]
+        if not missing:
+            return out
+        tok = await self._token_provider()
+        if not tok:
+            return {**out, **{k: {"error": "Ingen giltig token."} for k in missing}}
+        results = await asyncio.gather(
+            *(self.get(resources[k], start, end, timeout=timeouts.get(k), token=tok)
+              for k in missing)
+        )
+        out.update(zip(missing, results))
+        return {k: out[k] for k in resources}
+
+    async def _activity_pages(self, start: str, end: str, h: Dict[str, str]
+                              ) -> Tuple[Dict[str, List[Dict[str, Any]]], bool]:
+        """Bläddrar framåt från start (afterDate, sort=asc) tills sista posten passerat end.
+
+        Returnerar (per dag, komplett). Ofullständigt fönster (fel/sidgräns) cachas inte.
+        """
+        out: Dict[str, List[Dict[str, Any]]] = {d: [] for d in date_range(start, end)}
+        after = (dt_date.fromisoformat(start) - timedelta(days=1)).isoformat()
+        url: Optional[str] = (
+            f"{self.base_url}/activities/list.json"
+            f"?afterDate={after}T23:59:59&sort=asc&limit={ACTIVITY_PAGE_LIMIT}&offset=0"
+        )
+        seen = set()
+        for _ in range(ACTIVITY_MAX_PAGES):
+            res = await self._call(url, h, self.timeout, ACTIVITY_LOGS)
+            if "error" in res:
+                return out, False
+            data = res.get("data") or {}
+            page = data.get("activities", [])
+            for a in page:
+                d = a.get("originalStartTime", "")[:10]
+                if d in out and a.get("logId") not in seen:
+                    seen.add(a.get("logId"))
+                    out[d].append(a)
+            url = (data.get("pagination") or {}).get("next")
+            if not page or not url or page[-1].get("originalStartTime", "")[:10] > end:
+                return out, True
+        return out, False
+
+    async def activity_logs_range(self, start: str, end: str, *,
+                                  token: Optional[Dict[str, Any]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Aktivitetsloggar för [start, end] grupperade per dag.
+
+        Cachade dagar hoppas över; spannet mellan första och sista saknade dag
+        hämtas en gång och varje dag i det sparas (även tomma dagar).
+        """
+        days = date_range(start, end)
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        missing: List[str] = []
+        for d in days:
+            hit = self._cached(ACTIVITY_LOGS, d, d)
+            if hit is not None:
+                out[d] = hit.get("data", {}).get("activities", [])
+            else:
+                missing.append(d)
+        if missing:
+            h = await self._headers(token)
+            if not h:
+                return {d: out.get(d, []) for d in days}
+            fetched, complete = await self._activity_pages(missing[0], missing[-1], h)
+            for d, acts in fetched.items():
+                if d in out:
+                    continue                      # redan cachad dag inne i spannet
+                out[d] = acts
+                if complete and self.cache is not None:
+                    self.cache.set(ACTIVITY_LOGS, d, {"data": {"activities": acts}})
+        return {d: out.get(d, []) for d in days}
+
+    async def fetch_range(self, start: str, end: str,
+                          resources: Optional[Dict[str, str]] = None,
+                          timeouts: Optional[Dict[str, float]] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Hämtar varje resurs för hela [start, end] och returnerar {datum: {resurs: blob}}.
+
+        Antal upstream-anrop blir O(resurser × chunkar) i stället för O(dagar × resurser).
+        Cachade dagar hoppas över; bara spannet mellan första och sista saknade dag hämtas.
+        """
+        resources = resources or EXTENDED_RESOURCES
+        timeouts = {**RESOURCE_TIMEOUTS, **(timeouts or {})}
+        days = date_range(start, end)
+        out: Dict[str, Dict[str, Dict[str, Any]]] = {d: {} for d in days}
+
+        jobs: List[Tuple[str, str, str]] = []
+        for k, path in resources.items():
+            missing = []
+            for d in days:
+                if (hit := self._cached(path, d, d)) is not None or \
+                        (hit := self._cached(path + RANGE_PART, d, d)) is not None:
+                    out[d][k] = hit
+                else:
+                    missing.append(d)
+            if missing:
+                jobs += [(k, cs, ce) for cs, ce in
+                         date_chunks(missing[0], missing[-1], RANGE_LIMITS.get(k, 30))]
+        if not jobs:
+            return out
+
+        tok = await self._token_provider()
+        if not tok:
+            for k, cs, ce in jobs:
+                for d in date_range(cs, ce):
+                    out[d].setdefault(k, {"error": "Ingen giltig token."})
+            return out
+        blobs = await asyncio.gather(
+            *(self.get(resources[k], cs, ce, timeout=timeouts.get(k), token=tok)
+              for k, cs, ce in jobs)
+        )
+        for (k, cs, ce), blob in zip(jobs, blobs):
+            # Flerdagsdelar utan aggregat får egen nyckel ⇒ /data/sleep m.fl. ser alltid hela dagssvaret
+            key = resources[k] + RANGE_PART if cs != ce and has_aggregates(blob) else resources[k]
+            for d, part in split_by_day(blob, date_range(cs, ce)).items():
+                if k in out[d]:
+                    continue                      # redan cachad dag inne i spannet
+                out[d][k] = part
+                if self.cache is not None:
+                    self.cache.set(key, d, part)
+        return out
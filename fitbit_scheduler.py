@@ -0,0 +1,216 @@
+# 🏋️‍♂️ FitGPT – fitbit_scheduler.py
+# ────────────────────────────────────────────────────────────────────────────
+# Central schemaläggare för Fitbit-anrop:
+# • Token bucket (150 anrop/timme) synkad mot Fitbit-Rate-Limit-*-headers
+# • Prioritetskö – interaktiva sammanfattningar före backfill/prewarm
+# • Coalescing – identiska samtidiga anrop delar ett och samma in-flight-anrop
+# • Stale fallback – senast kända svar i stället för att blockera när kvoten är slut
+# • 429 ⇒ kvoten nollas till Retry-After, ingen sleep i request-tråden
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+
+INTERACTIVE = 0
+BACKGROUND  = 1
+
+_priority: ContextVar[int] = ContextVar("fitbit_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """Sätter prioritet för alla Fitbit-anrop i blocket (ärvs av asyncio-tasks)."""
+    tok = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(tok)
+
+
+class RateLimited(Exception):
+    """Fitbit svarade 429 – bär Retry-After i sekunder."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Fitbit rate limit (Retry-After {retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+class RateLimitScheduler:
+    """Token bucket + prioritetskö + coalescing för ett Fitbit-konto."""
+
+    def __init__(self, limit: int = 150, window: float = 3600.0, *,
+                 reserve: int = 10,
+                 interactive_wait: float = 5.0,
+                 background_wait: float = 900.0,
+                 stale_size: int = 512):
+        self.capacity = float(limit)
+        self.window = window
+        self.reserve = reserve                  # sparas åt interaktiva anrop
+        self.interactive_wait = interactive_wait
+        self.background_wait = background_wait
+        self.tokens = float(limit)
+        self.reset_at: Optional[float] = None   # från Fitbit-Rate-Limit-Reset
+        self.blocked_until = 0.0                # efter 429
+        self._last = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stale: LRUCache = LRUCache(maxsize=stale_size)
+        self.stats = {"calls": 0, "coalesced": 0, "stale": 0, "rejected": 0, "rate_limited": 0}
+
+    # ── Bucket ──
+    def _refill(self):
+        now = time.monotonic()
+        if self.reset_at is not None and now >= self.reset_at:
+            self.tokens, self.reset_at = self.capacity, None
+        else:
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self._last) * self.capacity / self.window)
+        self._last = now
+
+    def _can_take(self, prio: int) -> bool:
+        if time.monotonic() < self.blocked_until:
+            return False
+        floor = 0 if prio == INTERACTIVE else self.reserve
+        return self.tokens >= 1 + floor
+
+    def _next_token_in(self, prio: int) -> float:
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        floor = 0 if prio == INTERACTIVE else self.reserve
+        rate_wait = max(0.0, 1 + floor - self.tokens) * self.window / self.capacity
+        if self.reset_at is not None:
+            rate_wait = min(rate_wait, max(0.0, self.reset_at - now))
+        return max(0.05, rate_wait)
+
+    def observe(self, headers) -> None:
+        """Synkar bucketen mot Fitbits egna siffror (Fitbit-Rate-Limit-*)."""
+        try:
+            limit = headers.get("Fitbit-Rate-Limit-Limit")
+            remaining = headers.get("Fitbit-Rate-Limit-Remaining")
+            reset = headers.get("Fitbit-Rate-Limit-Reset")
+            if limit is not None:
+                self.capacity = float(limit)
+            if remaining is not None:
+                self._refill()
+                self.tokens = min(self.tokens, float(remaining))
+            if reset is not None:
+                self.reset_at = time.monotonic() + float(reset)
+        except (TypeError, ValueError):
+            pass
+
+    def penalize(self, retry_after: float) -> None:
+        self.stats["rate_limited"] += 1
+        self.tokens = 0.0
+        self.blocked_until = time.monotonic() + retry_after
+
+    def status(self) -> Dict[str, Any]:
+        self._refill()
+        now = time.monotonic()
+        return {"tokens": round(self.tokens, 1),
+                "capacity": self.capacity,
+                "reset_in": round(self.reset_at - now) if self.reset_at else None,
+                "blocked_for": round(max(0.0, self.blocked_until - now)),
+                "queued": len(self._waiters),
+                "inflight": len(self._inflight),
+                **self.stats}
+
+    # ── Kö ──
+    async def _acquire(self, prio: int, timeout: float) -> bool:
+        self._refill()
+        if (not self._waiters or self._waiters[0][0] > prio) and self._can_take(prio):
+            self.tokens -= 1
+            return True
+        if timeout <= 0:
+            return False
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (prio, next(self._seq), fut))
+        self._wake.set()                        # ny kö-topp ⇒ räkna om väntetiden
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return True                     # token hann delas ut precis vid timeout
+            fut.cancel()
+            return False
+
+    async def _run_pump(self):
+        while self._waiters:
+            prio, _, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            self._refill()
+            if self._can_take(prio):
+                heapq.heappop(self._waiters)
+                self.tokens -= 1
+                fut.set_result(True)
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self._next_token_in(prio))
+            except asyncio.TimeoutError:
+                pass
+
+    # ── Publikt API ──
+    async def run(self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]], *,
+                  prio: Optional[int] = None) -> Dict[str, Any]:
+        """Kör fn() inom kvoten. Identiska samtidiga nycklar delar resultat.
+
+        fn ska returnera {"data": ...}/{"error": ...} och kasta RateLimited vid 429.
+        """
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            res = await self._run_once(key, fn, _priority.get() if prio is None else prio)
+            fut.set_result(res)
+            return res
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()                     # undvik "never retrieved"-varning
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_once(self, key: str, fn, prio: int) -> Dict[str, Any]:
+        stale = self._stale.get(key)
+        wait = self.interactive_wait if prio == INTERACTIVE else self.background_wait
+        if not await self._acquire(prio, 0 if stale else wait):
+            return self._fallback(key, stale)
+        self.stats["calls"] += 1
+        try:
+            res = await fn()
+        except RateLimited as e:
+            self.penalize(e.retry_after)
+            return self._fallback(key, self._stale.get(key))
+        if "error" not in res:
+            self._stale[key] = res
+        return res
+
+    def _fallback(self, key: str, stale: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if stale is not None:
+            self.stats["stale"] += 1
+            return {**stale, "stale": True}
+        self.stats["rejected"] += 1
+        return {"error": "Fitbit-kvoten är slut – försök igen senare.", "rate_limited": True}
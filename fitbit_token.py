@@ -0,0 +1,272 @@
+# 🏋️‍♂️ FitGPT – fitbit_token.py
+# ────────────────────────────────────────────────────────────────────────────
+# Token-hantering för Fitbit OAuth:
+# • Token hålls i minnet – filen läses bara om den ändrats (mtime) eller vid refresh
+# • Single-flight refresh: threading.Lock i processen + fcntl-fillås mellan
+#   uvicorn-workers; efter låset läses filen om (någon annan kan ha hunnit först)
+# • Atomisk skrivning: temp-fil i samma katalog + fsync + os.replace
+# • Bakgrundsloop som förnyar i god tid före utgång
+# • FirestoreTokenManager: samma logik med token i ett Firestore-dokument per
+#   användare, lease i stället för fillås, valfri kryptering (cryptography/Fernet)
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+try:                                    # fcntl saknas på Windows – då räcker tråd-låset
+    import fcntl
+except ImportError:                     # pragma: no cover
+    fcntl = None
+
+try:                                    # cryptography är valfritt – krävs bara med krypteringsnyckel
+    from cryptography.fernet import Fernet
+except ImportError:                     # pragma: no cover
+    Fernet = None
+
+Token = Dict[str, Any]
+RefreshFn = Callable[[str], Optional[Token]]   # refresh_token → nytt token (eller None)
+
+EXPIRY_SKEW = 60                        # s – räkna token som utgånget så här tidigt
+REFRESH_AHEAD = 600                     # s – bakgrundsloopen förnyar så här långt före
+DEFAULT_EXPIRES_IN = 28800
+LEASE_SECONDS = 30                      # s – max tid en process får hålla refresh-leasen
+
+
+def expires_at(t: Token) -> float:
+    return t.get("_saved_at", 0) + t.get("expires_in", DEFAULT_EXPIRES_IN)
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """Skriver JSON så att läsare aldrig ser en halv fil."""
+    d = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=d)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class TokenManager:
+    """Fitbit-token i minnet med en refresh åt gången (tråd + process)."""
+
+    def __init__(self, path: str, refresh: RefreshFn, *,
+                 skew: float = EXPIRY_SKEW, refresh_ahead: float = REFRESH_AHEAD):
+        self.path = path
+        self._refresh = refresh
+        self.skew = skew
+        self.refresh_ahead = refresh_ahead
+        self._token: Optional[Token] = None
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"reads": 0, "refreshes": 0, "adopted": 0, "failures": 0}
+        self.last_error: Optional[str] = None
+
+    # ── Fil ──
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _load(self) -> Optional[Token]:
+        """Läser filen om den ändrats sedan sist (annan worker, /callback)."""
+        mtime = self._file_mtime()
+        if mtime is None:
+            self._token, self._mtime = None, None
+            return None
+        if mtime != self._mtime:
+            try:
+                with open(self.path) as f:
+                    self._token = json.load(f)
+                self._mtime = mtime
+                self.stats["reads"] += 1
+            except (OSError, ValueError) as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+        return self._token
+
+    def _unchanged(self) -> bool:
+        """Snabbvägen i aget(): har ingen annan skrivit ett nytt token?"""
+        return self._file_mtime() == self._mtime
+
+    def _persist(self, t: Token) -> None:
+        write_json_atomic(self.path, t)
+        self._token, self._mtime = t, self._file_mtime()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _valid(self, t: Optional[Token], margin: float) -> bool:
+        return bool(t) and time.time() < expires_at(t) - margin
+
+    # ── API ──
+    def save(self, t: Token) -> Token:
+        """Sparar ett nytt token (t.ex. från /callback) atomiskt och i minnet."""
+        t = {**t, "_saved_at": time.time()}
+        with self._lock, self._file_lock():
+            self._persist(t)
+        return t
+
+    def get(self, *, margin: Optional[float] = None) -> Optional[Token]:
+        """Giltigt token eller None. Blockerande vid refresh – anropa via threadpool."""
+        margin = self.skew if margin is None else margin
+        t = self._load()
+        if self._valid(t, margin):
+            return t
+        with self._lock:                                   # en refresh per process
+            t = self._load()
+            if self._valid(t, margin):
+                return t
+            with self._file_lock():                        # … och en mellan processer
+                before = t
+                t = self._load()
+                if self._valid(t, margin):
+                    if t is not before:
+                        self.stats["adopted"] += 1
+                    return t
+                if not t or "refresh_token" not in t:
+                    return None
+                try:
+                    new = self._refresh(t["refresh_token"])
+                except Exception as e:
+                    new, self.last_error = None, f"{type(e).__name__}: {e}"
+                if not new:
+                    self.stats["failures"] += 1
+                    return t if self._valid(t, self.skew) else None
+                new = {**new, "_saved_at": time.time()}
+                self._persist(new)
+                self.stats["refreshes"] += 1
+                self.last_error = None
+                return new
+
+    async def aget(self) -> Optional[Token]:
+        """Snabbväg utan threadpool när token i minnet är giltigt."""
+        t = self._token
+        if self._valid(t, self.skew) and self._unchanged():
+            return t
+        return await asyncio.to_thread(self.get)
+
+    # ── Bakgrund ──
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _loop(self):
+        while True:
+            try:
+                t = await asyncio.to_thread(self.get, margin=self.refresh_ahead)
+            except Exception as e:                         # ett fel får inte stoppa förnyelsen
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"⚠️ Token-förnyelse ({self.path}) misslyckades: {self.last_error}")
+                t = None
+            if t:
+                wait = expires_at(t) - self.refresh_ahead - time.time()
+            else:
+                wait = 60.0                                # inget token ännu / refresh föll
+            await asyncio.sleep(min(max(wait, 5.0), 3600.0))
+
+    def status(self) -> Dict[str, Any]:
+        t = self._token
+        return {"has_token": bool(t),
+                "expires_in_s": round(expires_at(t) - time.time()) if t else None,
+                "last_error": self.last_error, **self.stats}
+
+
+class FirestoreTokenManager(TokenManager):
+    """Token i fältet `field` på ett Firestore-dokument (en per användare).
+
+    Single-flight mellan processer via en lease i samma dokument (transaktion);
+    med `key` krypteras token med Fernet innan det lagras.
+    """
+
+    def __init__(self, doc: Callable[[], Any], transaction: Callable[[], Any], refresh: RefreshFn, *,
+                 field: str = "fitbit_token", key: Optional[str] = None, **kw):
+        super().__init__(f"firestore:{field}", refresh, **kw)
+        self._doc = doc
+        self._transaction = transaction
+        self.field = field
+        if key and Fernet is None:
+            raise RuntimeError("Token-kryptering kräver paketet cryptography")
+        self._fernet = Fernet(key) if key else None
+
+    def _encode(self, t: Token) -> Any:
+        return self._fernet.encrypt(json.dumps(t).encode()).decode() if self._fernet else t
+
+    def _decode(self, v: Any) -> Optional[Token]:
+        if v is None or not self._fernet:
+            return v
+        return json.loads(self._fernet.decrypt(v.encode()))
+
+    def _file_mtime(self) -> Optional[float]:
+        return None
+
+    def _unchanged(self) -> bool:
+        return True                                        # andra processer upptäcks vid utgång
+
+    def _load(self) -> Optional[Token]:
+        try:
+            data = self._doc().get([self.field]).to_dict() or {}      # dokumentet kan sakna fältet
+            self._token = self._decode(data.get(self.field))
+            self.stats["reads"] += 1
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+        return self._token
+
+    def _persist(self, t: Token) -> None:
+        self._doc().set({self.field: self._encode(t)}, merge=[self.field])   # ersätt hela fältet
+        self._token = t
+
+    def _lease(self, until: float) -> bool:
+        from firestore_client import transactional
+
+        @transactional
+        def take(tx, ref):
+            data = ref.get(["refresh_lease"], transaction=tx).to_dict() or {}
+            if (data.get("refresh_lease") or 0) > time.time():
+                return False
+            tx.set(ref, {"refresh_lease": until}, merge=True)
+            return True
+
+        return take(self._transaction(), self._doc())
+
+    @contextmanager
+    def _file_lock(self):
+        deadline = time.time() + LEASE_SECONDS / 2
+        held = False
+        while not held and time.time() < deadline:
+            held = self._lease(time.time() + LEASE_SECONDS)
+            if not held:
+                time.sleep(0.5)
+        try:
+            yield                                          # utan lease: fortsätt ändå (bäst-effort)
+        finally:
+            if held:
+                self._doc().set({"refresh_lease": 0}, merge=True)
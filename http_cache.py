@@ -0,0 +1,144 @@
+# 🏋️‍♂️ FitGPT – http_cache.py
+# ────────────────────────────────────────────────────────────────────────────
+# Svarslager för summary-/proxy-vägar:
+# • Stabil innehålls-hash som ETag (samma JSON ⇒ samma ETag, oavsett process)
+# • Litet index nyckel → ETag i processen ⇒ 304 utan backend-läsning
+# • If-None-Match / If-Modified-Since; klienten revaliderar alltid (no-cache) eftersom
+#   även gamla dagar kan ändras (efterloggade måltider/pass)
+# • Index-posterna lever efter datumets ålder men högst INDEX_MAX_TTL – en skrivning i en
+#   annan worker invaliderar bara sitt eget index
+# • Invalidering per datum när något skrivs
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import orjson
+from cachetools import LRUCache
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+INDEX_MAX_TTL = 300.0                                   # s, tak för indexposter (även "oföränderliga" dagar)
+CACHE_CONTROL = "private, no-cache"
+_ORJSON_OPTS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+
+def render_json(content: Any) -> bytes:
+    """Kompakt, deterministisk JSON via orjson (sorterade nycklar ⇒ stabil hash)."""
+    return orjson.dumps(content, option=_ORJSON_OPTS, default=jsonable_encoder)
+
+
+def content_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [t.strip() for t in header.split(",")]
+    return etag in tags or any(t.startswith("W/") and t[2:] == etag for t in tags)
+
+
+class _Entry:
+    __slots__ = ("etag", "last_modified", "expires_at", "dates")
+
+    def __init__(self, etag: str, last_modified: float, expires_at: float, dates: frozenset):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.dates = dates
+
+
+class ConditionalCache:
+    """Index nyckel → (ETag, Last-Modified) med TTL efter datumens ålder (högst max_ttl)."""
+
+    def __init__(self, ttl_for: Callable[[str], Optional[float]], maxsize: int = 512,
+                 scope: Optional[Callable[[str], str]] = None, max_ttl: float = INDEX_MAX_TTL):
+        self._ttl_for = ttl_for
+        self.max_ttl = max_ttl
+        self._scope = scope or (lambda k: k)             # t.ex. användar-prefix på nycklar/datum
+        self._index: LRUCache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.stats = {"not_modified_index": 0, "not_modified_hash": 0, "full": 0}
+
+    def _ttl(self, dates: Iterable[str]) -> float:
+        return min([t for d in dates if (t := self._ttl_for(d)) is not None] + [self.max_ttl])
+
+    def lookup(self, key: str) -> Optional[_Entry]:
+        key = self._scope(key)
+        with self._lock:
+            e = self._index.get(key)
+            if e is not None and e.expires_at < time.time():
+                self._index.pop(key, None)
+                return None
+            return e
+
+    def store(self, key: str, etag: str, dates: Iterable[str]) -> _Entry:
+        dates = frozenset(dates)
+        ttl = self._ttl(dates)
+        key, dates = self._scope(key), frozenset(self._scope(d) for d in dates)
+        now = time.time()
+        with self._lock:
+            old = self._index.get(key)
+            lm = old.last_modified if old is not None and old.etag == etag else now
+            e = _Entry(etag, lm, now + ttl, dates)
+            self._index[key] = e
+            return e
+
+    def invalidate(self, d: str) -> None:
+        d = self._scope(d)
+        with self._lock:
+            for k in [k for k, e in self._index.items() if d in e.dates]:
+                self._index.pop(k, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._index.clear()
+
+    @staticmethod
+    def _headers(e: _Entry) -> Dict[str, str]:
+        return {"ETag": e.etag,
+                "Last-Modified": formatdate(e.last_modified, usegmt=True),
+                "Cache-Control": CACHE_CONTROL}
+
+    @staticmethod
+    def _fresh_for(request: Request, e: _Entry) -> bool:
+        inm = request.headers.get("if-none-match")
+        if inm is not None:                              # If-None-Match har företräde
+            return etag_matches(inm, e.etag)
+        ims = request.headers.get("if-modified-since")
+        if ims:
+            try:
+                return int(e.last_modified) <= parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def not_modified(self, request: Request, key: str) -> Optional[Response]:
+        """304 direkt från indexet – ingen Firestore/Fitbit-läsning."""
+        e = self.lookup(key)
+        if e is not None and self._fresh_for(request, e):
+            self.stats["not_modified_index"] += 1
+            return Response(status_code=304, headers=self._headers(e))
+        return None
+
+    def respond(self, request: Request, key: str, content: Any,
+                dates: Iterable[str], *, cacheable: bool = True) -> Response:
+        body = render_json(content)
+        etag = content_etag(body)
+        if not cacheable:
+            return Response(body, media_type="application/json",
+                            headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+        e = self.store(key, etag, dates)
+        if self._fresh_for(request, e):
+            self.stats["not_modified_hash"] += 1
+            return Response(status_code=304, headers=self._headers(e))
+        self.stats["full"] += 1
+        return Response(body, media_type="application/json", headers=self._headers(e))
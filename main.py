@@ -14,25 +14,57 @@
 # • NYTT: dagliga snapshots + ETag-cache (/v1/summaries/daily)
 # • UPPDATERAT (2025-08-18): MealLog.items = LISTA AV STRÄNGAR (List[str]), 201-svar på /log/meal,
 #   fallback om meal saknas, samt /_echo för diagnostik – alla med auth.
+# • ASYNC (2026-10): Fitbit via poolad httpx-klient (fitbit_client.py), parallell fan-out,
+#   timeout per resurs, summary-vägar som async def.
+# • LAZY START (2026-10): lifespan i stället för on_event; Firestore-klienten byggs vid första
+#   användning eller av warm-up i bakgrunden (firestore_client.py).
+# • FLERA ANVÄNDARE (2026-10): API_USERS (nyckel → uid) ⇒ data under users/<uid>/, token i
+#   Firestore, egen Fitbit-kvot/cache per användare, delad HTTP-pool (tenancy.py).
+# • PROFIL (2026-10): profilen cachas i minnet med version (ETag/304), If-Match ⇒ 412 vid
+#   krock, atomiska skrivningar; kcal-mål i /sammanfatta (profile_store.py).
+# • TRENDER (2026-10): /v1/trends – glidande medel/median, energibalans och avvikelse från
+#   baslinjen i ett numpy-svep över snapshots, cachat per datumfönster (trends.py).
 
 from __future__ import annotations
 
 # ─────────  Standard & 3P  ─────────
-import os, json, re, time, base64, requests
+import os, json, time, base64, asyncio, hashlib, hmac, requests
+from collections import deque
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone, date as dt_date
-from typing import Optional, List, Dict, Any, Set
+from traceback import format_exc
+from typing import Optional, List, Dict, Any, Set, FrozenSet, Tuple
 
-from fastapi import FastAPI, HTTPException, Body, Depends, Request
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
+from fastapi import FastAPI, HTTPException, Body, Depends, Query, Request, status
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator, root_validator, ConfigDict
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, validator, root_validator, ConfigDict, ValidationError
 from zoneinfo import ZoneInfo
-from cachetools import TTLCache
+from cachetools import LRUCache, TTLCache
 from dotenv import load_dotenv
 
-from google.oauth2 import service_account
-from google.cloud import firestore
+from fitbit_client import FitbitClient, EXTENDED_RESOURCES, date_range, new_http_client
+from fitbit_scheduler import RateLimitScheduler, BACKGROUND, priority
+from fitbit_cache import FitbitCache, ttl_for_date
+from fitbit_token import FirestoreTokenManager, TokenManager
+from firestore_client import FirestoreProvider, increment, server_timestamp, transactional
+from datastore import DataStore, MEAL_KCAL_FIELDS, SNAPSHOT_META, begin_scope, end_scope
+from http_cache import CACHE_CONTROL, ConditionalCache, etag_matches, render_json
+from metrics import (CallbackMetric, Counter, Histogram, begin_request, end_request,
+                     render_prometheus, server_timing, span, timed)
+from prewarm import Prewarmer
+from profile_store import ProfileStore, VersionConflict, targets as profile_targets
+from snapshot_worker import SnapshotWorker
+from tenancy import (DEFAULT_USER, TenantRegistry, current_user, parse_api_users, reset_user,
+                     set_user, split_user_key, use_user, user_key)
+from rollups import (PERIODS, ROLLUP_VERSION, build_rollup, day_entry, period_bounds,
+                     period_key, period_keys, rollup_id)
+from trends import compute as compute_trends, day_row as trend_row, first_date as trend_first_date, \
+    parse_metrics as parse_trend_metrics
+from workout_merge import merge_workouts, merge_workouts_range, guess_auto_match
 
 # ─────────  Init  ─────────
 load_dotenv()
@@ -41,27 +73,92 @@ SE_TZ = ZoneInfo("Europe/Stockholm")
 FITBIT_CLIENT_ID     = os.getenv("FITBIT_CLIENT_ID")
 FITBIT_CLIENT_SECRET = os.getenv("FITBIT_CLIENT_SECRET")
 REDIRECT_URI         = os.getenv("REDIRECT_URI", "https://fitgpt-2364.onrender.com/callback")
-TOKEN_FILE           = "fitbit_token.json"
+TOKEN_FILE           = os.getenv("FITBIT_TOKEN_FILE", "fitbit_token.json")
 PROFILE_FILE         = "user_profile.json"
 API_KEY_REQUIRED     = os.getenv("API_KEY")
+API_USERS            = parse_api_users(os.getenv("API_USERS"))         # nyckel → uid; tom = en användare
+FITBIT_TOKEN_KEY     = os.getenv("FITBIT_TOKEN_KEY")                   # Fernet-nyckel för tokens i Firestore
+FITBIT_API_BASE      = os.getenv("FITBIT_API_BASE", "https://api.fitbit.com/1/user/-")
+FITBIT_RATE_LIMIT    = int(os.getenv("FITBIT_RATE_LIMIT", "150"))     # anrop/timme/användare
+FITBIT_CACHE_DB      = os.getenv("FITBIT_CACHE_DB", "fitbit_cache.sqlite3")
+SNAPSHOT_MAX_AGE     = int(os.getenv("SNAPSHOT_MAX_AGE", "1800"))     # s, gäller idag/igår
+SNAPSHOT_DEBOUNCE    = float(os.getenv("SNAPSHOT_DEBOUNCE", "2.0"))   # s, write-behind-fönster
+SNAPSHOT_WORKERS     = int(os.getenv("SNAPSHOT_WORKERS", "2"))
+STREAM_CHUNK_DAYS    = int(os.getenv("STREAM_CHUNK_DAYS", "7"))       # dagar per intervall-bygge
+STREAM_LOOKAHEAD     = int(os.getenv("STREAM_LOOKAHEAD", "2"))        # chunkar som byggs i förväg
+STREAM_MAX_DAYS      = 1095
+PREWARM_ENABLED      = os.getenv("PREWARM_ENABLED", "1") == "1"
+PREWARM_INTERVAL     = float(os.getenv("PREWARM_INTERVAL", "3600"))   # s mellan vanliga körningar
+PREWARM_AT           = os.getenv("PREWARM_AT", "00:05,08:30")         # lokal tid; 08:30 ≈ efter sömn-synk
+PREWARM_MIN_TOKENS   = int(os.getenv("PREWARM_MIN_TOKENS", "40"))     # lägre Fitbit-kvar ⇒ hoppa över
+ETAG_INDEX_TTL       = float(os.getenv("ETAG_INDEX_TTL", "300"))      # s, tak för 304 ur indexet (flera workers)
+RANGE_MAX_DAYS       = 366                                            # /v1/summaries/range (större ⇒ strömma)
+TRENDS_MAX_DAYS      = 366                                            # /v1/trends, exkl. lookback
+TRENDS_MAX_WINDOW    = 90                                             # dagar, både window och baseline
 
 # ─────────  FastAPI  ─────────
-app = FastAPI(title="FitGPT-API")
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """Bakgrundsloopar startas direkt; Firestore/Fitbit värms i en task så att
+    /health, /time och /.well-known svarar utan att vänta på klient-init."""
+    for uid in TENANTS.configured():
+        TENANTS.get(uid).tokens.start()
+    SNAPSHOT_WORKER.start()
+    if PREWARM_ENABLED:
+        PREWARMER.start()
+    warm = asyncio.create_task(_warmup())
+    try:
+        yield
+    finally:
+        warm.cancel()
+        await PREWARMER.stop()
+        await SNAPSHOT_WORKER.stop()
+        for t in TENANTS.loaded():
+            await t.aclose()
+        if _HTTP is not None:
+            await _HTTP.aclose()
+
+
+app = FastAPI(title="FitGPT-API", lifespan=_lifespan)
 app.mount("/.well-known", StaticFiles(directory=".well-known"), name="well-known")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://chat.openai.com"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Server-Timing"],
 )
-
-# ─────────  Firestore  ─────────
-cred_info: Dict[str, Any] = json.loads(os.getenv("FIREBASE_CRED_JSON", "{}"))
-firebase_creds = service_account.Credentials.from_service_account_info(cred_info)
-db = firestore.Client(credentials=firebase_creds, project=cred_info.get("project_id"))
-MEAL_COL        = db.collection("meals")
-WORKOUT_COL     = db.collection("workouts")
-SNAPSHOT_COL    = db.collection("daily_snapshots")          # 🆕 snapshot-samling
+try:                                    # brotli är valfritt – gzip räcker annars
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1024)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# ─────────  Firestore (lazy)  ─────────
+def _make_db():
+    """Service-account i drift; FIRESTORE_EMULATOR_HOST ⇒ emulatorn;
+    FITGPT_FIRESTORE=memory ⇒ in-memory-fake (benchmark/lokalt, se tools/)."""
+    if os.getenv("FITGPT_FIRESTORE") == "memory":
+        from tools.fake_firestore import FakeFirestore
+        return FakeFirestore()
+    from google.cloud import firestore
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        return firestore.Client(project=os.getenv("FIRESTORE_PROJECT", "fitgpt-local"))
+    from google.oauth2 import service_account
+    cred_info: Dict[str, Any] = json.loads(os.getenv("FIREBASE_CRED_JSON", "{}"))
+    firebase_creds = service_account.Credentials.from_service_account_info(cred_info)
+    return firestore.Client(credentials=firebase_creds, project=cred_info.get("project_id"))
+
+
+# Klienten byggs vid första användning (eller av _warmup) – inte vid import.
+# Samlingar per användare: default ⇒ toppnivå (meals, workouts, daily_snapshots,
+# summary_rollups), övriga ⇒ users/<uid>/… – se Tenant nedan.
+DB              = FirestoreProvider(_make_db)
+_db             = DB.client
+
+
+def _user_doc(uid: str):
+    return _db().collection("users").document(uid)
 
 # ─────────  Datum-helpers  ─────────
 ALIAS = {"idag": 0, "igår": 1, "förrgår": 2}
@@ -86,9 +183,27 @@ def _resolve_date(val: Optional[str] = None, *, days_back: Optional[int] = None)
 
 # ─────────  Cache  ─────────
 CACHE = TTLCache(maxsize=128, ttl=60)
-_cache_get        = CACHE.get
-_cache_set        = CACHE.__setitem__
-_cache_invalidate = lambda k: CACHE.pop(k, None)        # safe pop
+SUMMARY_CACHE = Counter("summary_cache_total", "Dags-summary ur minnescachen", ["result"])
+
+
+def _cache_get(k: str):
+    v = CACHE.get(user_key(k))
+    SUMMARY_CACHE.inc(result="hit" if v is not None else "miss")
+    return v
+
+
+def _cache_set(k: str, v):
+    CACHE[user_key(k)] = v
+
+# ETag-index för villkorliga GET (304 utan backend-läsning), nycklat per användare
+ETAGS = ConditionalCache(lambda d: ttl_for_date(d, _today_se()), scope=user_key,
+                         max_ttl=ETAG_INDEX_TTL)
+
+
+def _cache_invalidate(k: str):
+    CACHE.pop(user_key(k), None)                        # safe pop
+    ETAGS.invalidate(k)
+    _store().invalidate(k)                              # delade query-resultat i samma request
 
 # ─────────  Pydantic-modeller  ─────────
 class MealLog(BaseModel):
@@ -131,8 +246,24 @@ class WorkoutLog(BaseModel):
         extra = "forbid"
 
 # ─────────  Auth helper  ─────────
+def _bearer(request: Request) -> Optional[str]:
+    auth = request.headers.get("authorization") or ""
+    return auth[7:] if auth.startswith("Bearer ") else None
+
+
+def _request_user(request: Request) -> Optional[str]:
+    """Vems data requestet gäller: bearer-identiteten (API_USERS) eller default."""
+    return TENANTS.identify(_bearer(request)) if TENANTS.multi else DEFAULT_USER
+
+
+def _authorized(request: Request) -> bool:
+    if TENANTS.multi:
+        return TENANTS.identify(_bearer(request)) is not None
+    return not API_KEY_REQUIRED or _bearer(request) == API_KEY_REQUIRED
+
+
 def verify_auth(request: Request):
-    if API_KEY_REQUIRED and request.headers.get("authorization") != f"Bearer {API_KEY_REQUIRED}":
+    if not _authorized(request):
         raise HTTPException(401, "Missing or invalid token")
 
 # ─────────  Mini-UI  ─────────
@@ -148,19 +279,38 @@ def home():
     """
 
 # ─────────  Fitbit OAuth  ─────────
+def _sign_state(uid: str) -> str:
+    mac = hmac.new((FITBIT_CLIENT_SECRET or "").encode(), uid.encode(), hashlib.sha256).hexdigest()
+    return f"{uid}.{mac[:32]}"
+
+
+def _verify_state(state: Optional[str]) -> Optional[str]:
+    uid = (state or "").rpartition(".")[0]
+    return uid if uid and hmac.compare_digest(_sign_state(uid), state) else None
+
+
 @app.get("/authorize")
-def authorize():
+def authorize(request: Request, key: Optional[str] = None):
+    """Flera användare: identitet via bearer-header eller ?key=, bärs genom OAuth som signerat state."""
     scope = "activity nutrition sleep heartrate weight location profile"
     url = (
         "https://www.fitbit.com/oauth2/authorize?response_type=code"
         f"&client_id={FITBIT_CLIENT_ID}&redirect_uri={REDIRECT_URI}"
         f"&scope={scope.replace(' ', '%20')}"
     )
+    if TENANTS.multi:
+        uid = TENANTS.identify(_bearer(request) or key)
+        if uid is None:
+            raise HTTPException(401, "Missing or invalid token")
+        url += f"&state={_sign_state(uid)}"
     return RedirectResponse(url)
 
 
 @app.get("/callback")
-def callback(code: str):
+def callback(code: str, state: Optional[str] = None):
+    uid = _verify_state(state) if TENANTS.multi else DEFAULT_USER
+    if uid is None:
+        raise HTTPException(400, "Ogiltigt state")
     b64 = base64.b64encode(f"{FITBIT_CLIENT_ID}:{FITBIT_CLIENT_SECRET}".encode()).decode()
     r = requests.post(
         "https://api.fitbit.com/oauth2/token",
@@ -173,8 +323,7 @@ def callback(code: str):
     )
     data = r.json()
     if "access_token" in data:
-        data["_saved_at"] = time.time()
-        json.dump(data, open(TOKEN_FILE, "w"))
+        TENANTS.get(uid).tokens.save(data)
         return {"message": "✅ Token sparad"}
     raise HTTPException(400, data)
     
@@ -187,137 +336,362 @@ def current_time():
     }
 
 # ─────────  Profil-endpoints  ─────────
-def _load_profile() -> Dict[str, Any]:
-    return json.load(open(PROFILE_FILE)) if os.path.exists(PROFILE_FILE) else {}
-
-def _save_profile(p: Dict[str, Any]):
-    json.dump(p, open(PROFILE_FILE, "w"), ensure_ascii=False, indent=2)
-
 @app.get("/user_profile")
-def get_profile(): return _load_profile()
+async def get_profile(request: Request):
+    p, version = await _tenant().profile.aget()
+    headers = {"ETag": version, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), version):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(p, headers=headers)
 
 @app.post("/user_profile")
-def set_profile(p: Dict[str, Any]):
+async def set_profile(request: Request, p: Dict[str, Any]):
+    """Hela profilen ersätts. If-Match: <ETag från GET> ⇒ 412 om någon annan hunnit spara."""
     if not isinstance(p, dict):
         raise HTTPException(400, "Body måste vara ett JSON-objekt.")
-    _save_profile(p)
-    return {"message": "✅ Sparat!", "profile": p}
+    try:
+        version = await run_in_threadpool(_tenant().profile.put, p, request.headers.get("if-match"))
+    except VersionConflict as e:
+        return JSONResponse({"detail": "Profilen har ändrats – hämta den igen.", "version": e.current},
+                            status_code=412, headers={"ETag": e.current})
+    return JSONResponse({"message": "✅ Sparat!", "profile": p, "version": version},
+                        headers={"ETag": version, "Cache-Control": CACHE_CONTROL})
 
 # ─────────  Fitbit helpers  ─────────
 def _fitbit_auth_header():
     b64 = base64.b64encode(f"{FITBIT_CLIENT_ID}:{FITBIT_CLIENT_SECRET}".encode()).decode()
     return {"Authorization": f"Basic {b64}", "Content-Type": "application/x-www-form-urlencoded"}
 
-def _read_token():  return json.load(open(TOKEN_FILE))
-def _write_token(t): json.dump(t, open(TOKEN_FILE, "w"))
-
-def _refresh_token_if_needed():
-    if not os.path.exists(TOKEN_FILE):
-        return None
-    t = _read_token()
-    if time.time() < t["_saved_at"] + t.get("expires_in", 28800) - 60:
-        return t
+def _post_refresh(refresh_token: str) -> Optional[Dict[str, Any]]:
     r = requests.post(
         "https://api.fitbit.com/oauth2/token",
         headers=_fitbit_auth_header(),
-        data={"grant_type": "refresh_token", "refresh_token": t["refresh_token"]},
+        data={"grant_type": "refresh_token", "refresh_token": refresh_token},
+        timeout=10,
     )
     if r.status_code == 200:
-        new = r.json(); new["_saved_at"] = time.time(); _write_token(new); return new
+        return r.json()
+    print(f"⚠️ Token-refresh misslyckades: {r.status_code} {r.text[:200]}")
     return None
 
 
-def _fitbit_get(path: str, start: str, end: str):
-    tok = _refresh_token_if_needed()
-    if not tok:
-        return {"error": "Ingen giltig token."}
-    h = {"Authorization": f"Bearer {tok['access_token']}"}
-    url = f"https://api.fitbit.com/1/user/-/{path}/date/{start}/{end}.json"
-    r = requests.get(url, headers=h)
-    if r.status_code == 429:
-        time.sleep(int(r.headers.get("Retry-After", 5)))
-        r = requests.get(url, headers=h)
-    try:
-        r.raise_for_status()
-        return {"data": r.json()}
-    except Exception as e:
-        return {"error": str(e)}
+# ─────────  Användare (tenancy)  ─────────
+# En delad, poolad HTTP-klient per process (skapas lazy i event-loopen)
+_HTTP = None
 
 
-def _fitbit_activity_logs(date_str: str):
-    tok = _refresh_token_if_needed()
-    if not tok:
-        return []
-    h = {"Authorization": f"Bearer {tok['access_token']}"}
-    url = (
-        "https://api.fitbit.com/1/user/-/activities/list.json"
-        f"?beforeDate={date_str}T23:59:59&sort=desc&limit=50&offset=0"
-    )
-    try:
-        raw = requests.get(url, headers=h).json().get("activities", [])
-        return [a for a in raw if a.get("originalStartTime", "").startswith(date_str)]
-    except Exception:
-        return []
+def _http_pool():
+    global _HTTP
+    if _HTTP is None:
+        _HTTP = new_http_client()
+    return _HTTP
 
-# ─────────  Workout-helpers  ─────────
-def _extract_duration_min(t: str):
-    m = re.search(r"(\d+)\s*(?:min|\bmins?\b|\bm\b)", t.lower()) if t else None
-    return int(m.group(1)) if m else None
 
+def _fitbit_cache_path(uid: str) -> str:
+    if not FITBIT_CACHE_DB or uid == DEFAULT_USER:
+        return FITBIT_CACHE_DB
+    root, ext = os.path.splitext(FITBIT_CACHE_DB)
+    return f"{root}.{uid}{ext}"
 
-def _guess_auto_match(m: Dict[str, Any], auto_logs, used: Set[int]):
-    dur_m = _extract_duration_min(m.get("details", "")) or None
-    wt_m = m.get("type", "").lower()
-    best_idx, best_score = None, 0.0
-    for idx, a in enumerate(auto_logs):
-        if idx in used:
-            continue
-        name = a.get("activityName", "").lower()
-        score = 0.0
-        if wt_m and wt_m in name:
-            score += 0.6
-        elif name and name in wt_m:
-            score += 0.4
-        dur_a = a.get("duration", 0) / 60000
-        if dur_m is not None:
-            diff = abs(dur_a - dur_m) / max(dur_a, dur_m, 1)
-            score += 0.4 if diff <= 0.05 else 0.2 if diff <= 0.15 else 0.0
-        if score > best_score:
-            best_idx, best_score = idx, score
-    return best_idx, best_score
-
-
-def _infer_start_time(entry: WorkoutLog):
-    auto = _fitbit_activity_logs(entry.date)
-    idx, conf = _guess_auto_match(entry.dict(by_alias=True, exclude_none=True), auto, set())
+
+class Tenant:
+    """En användares lagring, Fitbit-token och Fitbit-klient (egen kvot + cache, delad pool)."""
+
+    def __init__(self, uid: str):
+        self.uid = uid
+        legacy = uid == DEFAULT_USER
+        self.store = DataStore(DB, "" if legacy else f"users/{uid}/")
+        # Token i minnet, en refresh åt gången (tråd + fillås/lease), förnyas i bakgrunden
+        self.tokens = TokenManager(TOKEN_FILE, _post_refresh) if legacy else \
+            FirestoreTokenManager(lambda: _user_doc(uid), lambda: _db().transaction(),
+                                  _post_refresh, key=FITBIT_TOKEN_KEY)
+        # Profil: fil för default-användaren (+ Firestore om tillgängligt), annars users/<uid>.profile
+        self.profile = ProfileStore(doc=lambda: _user_doc(uid), transaction=lambda: _db().transaction(),
+                                    path=PROFILE_FILE if legacy else None)
+        self.fitbit_client: Optional[FitbitClient] = None
+
+    def fitbit(self) -> FitbitClient:
+        if self.fitbit_client is None:
+            self.fitbit_client = FitbitClient(self.tokens.aget, base_url=FITBIT_API_BASE,
+                                              scheduler=RateLimitScheduler(FITBIT_RATE_LIMIT),
+                                              cache=FitbitCache(_fitbit_cache_path(self.uid),
+                                                                today=_today_se),
+                                              http=_http_pool())
+        return self.fitbit_client
+
+    async def aclose(self):
+        await self.tokens.stop()
+        if self.fitbit_client is not None:
+            await self.fitbit_client.aclose()
+
+
+TENANTS = TenantRegistry(Tenant, API_USERS)
+
+
+def _tenant() -> Tenant:
+    uid = current_user()
+    if uid is None:
+        if TENANTS.multi:
+            raise HTTPException(401, "Missing or invalid token")
+        uid = DEFAULT_USER
+    return TENANTS.get(uid)
+
+
+def _store() -> DataStore:
+    return _tenant().store
+
+
+def _fitbit() -> FitbitClient:
+    return _tenant().fitbit()
+
+
+@timed("fitbit_get")
+async def _fitbit_get(path: str, start: str, end: str):
+    return await _fitbit().get(path, start, end)
+
+
+async def _fitbit_activity_logs(date_str: str):
+    return await _fitbit().activity_logs(date_str)
+
+# ─────────  Workout-helpers  ─────────
+def _match_start_time(entry: WorkoutLog, auto: List[Dict[str, Any]],
+                      used: Optional[Set[int]] = None) -> Optional[str]:
+    """Starttid från bästa Fitbit-aktivitet; used = redan tilldelade index (bulk)."""
+    used = set() if used is None else used
+    idx, conf = guess_auto_match(entry.dict(by_alias=True, exclude_none=True), auto, used)
     if idx is not None and conf >= 0.6:
+        used.add(idx)
         return auto[idx]["originalStartTime"][:-6]
     return None
 
-# ─────────  Firestore-helpers  ─────────
+
+async def _infer_start_time(entry: WorkoutLog):
+    return _match_start_time(entry, await _fitbit_activity_logs(entry.date))
+
+# ─────────  Firestore-helpers (se datastore.py)  ─────────
 def _fetch_meals(d: str) -> List[Dict[str, Any]]:
-    return [{"id": doc.id, **doc.to_dict()} for doc in MEAL_COL.where("date", "==", d).stream()]
+    return _store().day_docs("meals", d)
 
 
 def _fetch_manual_workouts(d: str) -> List[Dict[str, Any]]:
-    return [{"id": doc.id, **doc.to_dict()} for doc in WORKOUT_COL.where("date", "==", d).stream()]
+    return _store().day_docs("workouts", d)
 
 # ─────────  Snapshot-helper  🆕  ─────────
-def _update_daily_snapshot(d: str):
-    """Bygger dags-sammanfattning och sparar i snapshot-samlingen."""
-    summary = _build_daily_summary(d)
-    summary["updated_at"] = firestore.SERVER_TIMESTAMP
-    SNAPSHOT_COL.document(d).set(summary)
+SNAPSHOT_VERSION = 2          # höj när summary-formen ändras ⇒ gamla snapshots byggs om
+
+
+def _snapshot_stale(data: Dict[str, Any], d: str, *, dirty_ok: bool = False) -> bool:
+    """Fel version, oapplicerade skrivningar (dirty), eller idag/igår och äldre än
+    SNAPSHOT_MAX_AGE (Fitbit efter-synkar)."""
+    if data.get("snapshot_version") != SNAPSHOT_VERSION:
+        return True
+    if data.get("dirty") and not dirty_ok:
+        return True
+    if d < (_today_se() - timedelta(days=1)).isoformat():
+        return False
+    ts = data.get("updated_at")
+    if not isinstance(ts, datetime):
+        return True
+    return (datetime.now(timezone.utc) - ts).total_seconds() > SNAPSHOT_MAX_AGE
+
+
+def _snapshot_public(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in data.items() if k not in ("updated_at", "snapshot_version", "dirty")}
+
+
+def _mark_snapshot_dirty(batch, d: str):
+    """I samma batch som skrivningen: dirty räknar skrivningar som snapshoten saknar.
+    Överlever omstart och uttömda retries – _snapshot_stale bygger om vid nästa läsning."""
+    batch.set(_store().snapshots.document(d), {"dirty": increment(1)}, merge=True)
+
+
+async def _update_daily_snapshot(d: str):
+    """Bygger dags-sammanfattning och sparar i snapshot-samlingen (full rebuild)."""
+    summary = await _build_daily_summary(d)
+    doc = {**summary, "snapshot_version": SNAPSHOT_VERSION,
+           "updated_at": server_timestamp()}
+    await run_in_threadpool(_store().snapshots.document(d).set, doc)
+    ETAGS.invalidate(d)
+    await _update_rollups({d: summary})
+    return summary
+
+
+@transactional
+def _tx_patch_snapshot(tx, ref, d: str, patch_fn, writes: int):
+    """Läser snapshot i transaktionen, applicerar patch_fn och skriver bara de ändrade fälten.
+    Returnerar None om snapshot saknas/är inaktuell eller saknar fler skrivningar än de
+    `writes` som patchen bär (t.ex. en skur som tappats vid omstart) ⇒ full rebuild."""
+    snap = ref.get(_SNAPSHOT_LIGHT, transaction=tx)      # fitbit-bloben rörs aldrig av en patch
+    if not snap.exists:
+        return None
+    data = snap.to_dict()
+    if _snapshot_stale(data, d, dirty_ok=True) or (data.get("dirty") or 0) > writes:
+        return None
+    patch = patch_fn(data)
+    tx.update(ref, {**patch, "dirty": 0, "updated_at": server_timestamp()})
+    return _snapshot_public({**data, **patch})
+
+
+async def _patch_snapshot(d: str, patch_fn, writes: int):
+    ref = _store().snapshots.document(d)
+    out = await run_in_threadpool(
+        lambda: _tx_patch_snapshot(_db().transaction(), ref, d, patch_fn, writes))
+    if out is None:
+        return await _update_daily_snapshot(d)
+    ETAGS.invalidate(d)
+    await _update_rollups({d: out})
+    return out
+
+
+# ─────────  Rollups (vecka/månad)  ─────────
+@transactional
+def _tx_rollup(tx, ref, period: str, key: str, entries: Dict[str, Dict[str, Any]]):
+    """Lägger in dagarnas utdrag i per_day och räknar om summor/snitt/trend."""
+    snap = ref.get(transaction=tx)
+    data = snap.to_dict() if snap.exists else {}
+    per_day = dict(data.get("per_day") or {}) if data.get("rollup_version") == ROLLUP_VERSION else {}
+    per_day.update(entries)
+    tx.set(ref, {**build_rollup(period, key, per_day), "updated_at": server_timestamp(),
+                 "filled_through": data.get("filled_through", "")})
+
+
+def _update_rollups_sync(summaries: Dict[str, Dict[str, Any]]):
+    groups: Dict[Any, Dict[str, Dict[str, Any]]] = {}
+    for d, s in summaries.items():
+        if "error" in s:
+            continue
+        for p in PERIODS:
+            groups.setdefault((p, period_key(p, d)), {})[d] = day_entry(s)
+    for (p, k), entries in groups.items():          # en transaktion per berört dokument
+        _tx_rollup(_db().transaction(), _store().rollups.document(rollup_id(p, k)), p, k, entries)
+
+
+async def _update_rollups(summaries: Dict[str, Dict[str, Any]]):
+    """Håller vecko-/månadsdokumenten i takt med dags-snapshots (fel här stoppar inte snapshoten)."""
+    try:
+        await run_in_threadpool(_update_rollups_sync, summaries)
+    except Exception:
+        print("⚠️ Rollup-uppdatering misslyckades:")
+        print(format_exc())
+
+
+async def _apply_snapshot_events(key: str, events):
+    """Applicerar en ihopslagen skur av skrivningar i EN transaktion.
+
+    Måltider ⇒ bara meals + kcal_in; pass ⇒ bara workouts mergas om;
+    Fitbit-blocken lämnas orörda. ("rebuild", _) ⇒ full rebuild.
+    key = user_key(datum) ⇒ jobbet körs som rätt användare.
+    Eget query-scope: faller patchen tillbaka på full rebuild återanvänds passen.
+    """
+    uid, d = split_user_key(key)
+    scope = begin_scope()
+    try:
+        with use_user(uid):
+            if any(kind == "rebuild" for kind, _ in events):
+                return await _update_daily_snapshot(d)
+            meals = {m["id"]: m for kind, m in events if kind == "meal"}
+            workouts = await _combine_workouts(d) if any(k == "workout" for k, _ in events) else None
+
+            def patch(data):
+                out: Dict[str, Any] = {}
+                if meals:
+                    kept = [m for m in data.get("meals", []) if m.get("id") not in meals]
+                    out["meals"] = kept + list(meals.values())
+                    out["kcal_in"] = _sum_cals(out["meals"])
+                if workouts is not None:
+                    out["workouts"] = workouts
+                return out
+            return await _patch_snapshot(d, patch, len(events))
+    finally:
+        end_scope(scope)
+
+
+SNAPSHOT_WORKER = SnapshotWorker(_apply_snapshot_events,
+                                 debounce=SNAPSHOT_DEBOUNCE, concurrency=SNAPSHOT_WORKERS)
+
+# ─────────  Prewarm (idag + igår)  ─────────
+async def _prewarm_user(force: bool):
+    """Snapshots för igår och idag på BACKGROUND-prioritet (aktuell användare).
+
+    force (klockslag) ⇒ alltid ny Fitbit-hämtning; annars bara inaktuella/saknade dagar.
+    """
+    done: Dict[str, str] = {}
+    with priority(BACKGROUND):
+        for d in (_resolve_date("igår"), _resolve_date("idag")):
+            if force:
+                _fitbit().cache.invalidate(d)
+            else:
+                doc = await run_in_threadpool(_store().snapshots.document(d).get,
+                                              ["snapshot_version", "updated_at", "dirty"])
+                if doc.exists and not _snapshot_stale(doc.to_dict(), d):
+                    done[d] = "fresh"
+                    continue
+            s = await _update_daily_snapshot(d)
+            if _cacheable(s) and not s.get("is_estimate"):
+                _cache_set(d, s)
+            done[d] = "rebuilt"
+    return done
+
+
+def _budget_ok(t: Tenant) -> bool:
+    return t.fitbit_client is None or t.fitbit_client.scheduler.status()["tokens"] >= PREWARM_MIN_TOKENS
+
+
+async def _prewarm_job(force: bool):
+    """Alla användare med token i tur och ordning; var och en mot sin egen Fitbit-kvot.
+
+    Flera användare ⇒ bara antal ok/skipped/failed (syns i publika /health – inga uid:n)."""
+    out: Dict[str, Any] = {}
+    counts = {"ok": 0, "skipped": 0, "failed": 0}
+    for uid in TENANTS.configured():
+        t = TENANTS.get(uid)
+        if not force and not _budget_ok(t):
+            out[uid] = "skipped: low Fitbit budget"
+        elif not await t.tokens.aget():
+            out[uid] = "skipped: no Fitbit token"
+        else:
+            try:
+                with use_user(uid):
+                    out[uid] = await _prewarm_user(force)
+            except Exception as e:
+                if not TENANTS.multi:
+                    raise
+                print(f"⚠️ Prewarm för {uid} misslyckades: {type(e).__name__}: {e}")
+                counts["failed"] += 1
+                continue
+        counts["skipped" if isinstance(out[uid], str) else "ok"] += 1
+    return counts if TENANTS.multi else out[DEFAULT_USER]
+
+
+def _prewarm_budget_ok() -> bool:
+    return any(_budget_ok(TENANTS.get(uid)) for uid in TENANTS.configured())
+
+
+PREWARMER = Prewarmer(_prewarm_job, tz=SE_TZ, interval=PREWARM_INTERVAL, at=PREWARM_AT,
+                      budget_ok=_prewarm_budget_ok)
+
+# ─────────  Warm-up (bakgrund, från lifespan)  ─────────
+async def _warmup():
+    """Firestore-klient + kanal och Fitbit-klient/cache innan första riktiga requestet."""
+    ok = await DB.warm(lambda c: c.collection("daily_snapshots").document(_today_se().isoformat())
+                       .get(["updated_at"]))
+    for uid in TENANTS.configured():
+        TENANTS.get(uid).fitbit()
+    print(f"🔥 Warm-up klar (firestore={'ok' if ok else 'fel'}, init {DB.init_seconds}s)")
 
 # ─────────  CRUD Meal  ─────────
 @app.post("/logga/måltid", status_code=201, dependencies=[Depends(verify_auth)])
 @app.post("/log/meal",     status_code=201, dependencies=[Depends(verify_auth)])  # legacy
-def post_meal(entry: MealLog = Body(...)):
+async def post_meal(entry: MealLog = Body(...)):
     meal_name = (entry.meal or "batch").lower()
     doc_id = f"{entry.date}-{meal_name}"
-    MEAL_COL.document(doc_id).set(entry.dict(exclude_none=True))
+    meal = entry.dict(exclude_none=True)
+    batch = _db().batch()
+    batch.set(_store().meals.document(doc_id), meal)
+    _mark_snapshot_dirty(batch, entry.date)
+    await run_in_threadpool(batch.commit)
     _cache_invalidate(entry.date)
-    _update_daily_snapshot(entry.date)                          # 🆕 håll snapshot aktuell
+    SNAPSHOT_WORKER.mark_dirty(user_key(entry.date), ("meal", {"id": doc_id, **meal}))  # write-behind
     # YAML-kompatibelt svar (201)
     return {"ok": True, "inserted_ids": [doc_id], "warnings": []}
 
@@ -330,14 +704,23 @@ def get_meals(date: str):
 # ─────────  CRUD Workout  ─────────
 @app.post("/logga/pass", dependencies=[Depends(verify_auth)])
 @app.post("/log/workout", dependencies=[Depends(verify_auth)])  # legacy
-def post_workout(entry: WorkoutLog = Body(...)):
+async def post_workout(entry: WorkoutLog = Body(...), wait: bool = False):
     if not entry.start_time:
-        entry.start_time = _infer_start_time(entry) or datetime.now(SE_TZ).isoformat()
-    doc_id = WORKOUT_COL.add(entry.dict(by_alias=True, exclude_none=True))[1].id
+        entry.start_time = await _infer_start_time(entry) or datetime.now(SE_TZ).isoformat()
+    ref, batch = _store().workouts.document(), _db().batch()
+    batch.set(ref, entry.dict(by_alias=True, exclude_none=True))
+    _mark_snapshot_dirty(batch, entry.date)
+    await run_in_threadpool(batch.commit)
+    doc_id = ref.id
     _cache_invalidate(entry.date)
-    _update_daily_snapshot(entry.date)                          # 🆕 håll snapshot aktuell
-    daily = _get_daily_summary(entry.date, force_fresh=True)
-    return {"toast": f"✅ Pass '{entry.workout_type}' loggat.", "daily": daily, "id": doc_id}
+    SNAPSHOT_WORKER.mark_dirty(user_key(entry.date), ("workout", None))        # write-behind
+    out = {"toast": f"✅ Pass '{entry.workout_type}' loggat.", "id": doc_id}
+    if wait:                                                        # ?wait=true ⇒ gammalt svar med daily
+        await SNAPSHOT_WORKER.flush(user_key(entry.date))
+        doc = await run_in_threadpool(_store().read_snapshot, entry.date)
+        out["daily"] = _snapshot_public(doc) if doc is not None else \
+            await _get_daily_summary(entry.date)
+    return out
 
 
 @app.get("/logga/pass")
@@ -345,61 +728,158 @@ def post_workout(entry: WorkoutLog = Body(...)):
 def get_workouts(date: str):
     return _fetch_manual_workouts(date)
 
-# ─────────  Merge-pass  ─────────
-def _combine_workouts(d: str):
-    """Slår ihop manuella och Fitbit-pass + hanterar tidszon."""
-    manual = [{**w, "source": "manual"} for w in _fetch_manual_workouts(d)]
-    auto   = [{**a, "source": "fitbit"}  for a in _fitbit_activity_logs(d)]
+# ─────────  Bulk-import (måltider + pass)  ─────────
+BULK_BATCH_SIZE = 500                   # Firestore: max 500 skrivningar per WriteBatch
 
-    merged: List[Dict[str, Any]] = []
-    used: Set[int] = set()
 
-    # 1) manuella med start_time
-    for m in manual:
-        st = m.get("start_time") or m.get("startTime")
-        if not st:
-            continue
+def _bulk_parse(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Ogiltig JSON: {e}")
+
+
+async def _bulk_items(request: Request):
+    """Ger (index, post). NDJSON strömmas rad för rad; JSON-array läses i ett svep."""
+    ctype = request.headers.get("content-type", "")
+    if "ndjson" in ctype or "jsonl" in ctype:
+        buf, i = b"", 0
+        async for chunk in request.stream():
+            *lines, buf = (buf + chunk).split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield i, _bulk_parse(line)
+                    i += 1
+        if buf.strip():
+            yield i, _bulk_parse(buf)
+        return
+    data = _bulk_parse(await request.body())
+    if isinstance(data, Exception):
+        raise HTTPException(400, str(data))
+    if not isinstance(data, list):
+        raise HTTPException(400, "Body måste vara en JSON-array eller NDJSON.")
+    for i, raw in enumerate(data):
+        yield i, raw
+
+
+def _bulk_entry(raw: Any):
+    """Validerar en post → ("meal", MealLog) | ("workout", WorkoutLog). kind kan utelämnas."""
+    if isinstance(raw, Exception):
+        raise raw
+    if not isinstance(raw, dict):
+        raise ValueError("Posten måste vara ett JSON-objekt.")
+    raw = dict(raw)
+    kind = raw.pop("kind", None) or (
+        "meal" if "items" in raw else
+        "workout" if "type" in raw or "workout_type" in raw else None
+    )
+    if kind == "meal":
+        return kind, MealLog(**raw)
+    if kind == "workout":
+        return kind, WorkoutLog(**raw)
+    raise ValueError("Okänd posttyp – ange kind: meal | workout.")
+
+
+def _bulk_error(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, x['loc'])) or 'post'}: {x['msg']}" for x in e.errors())
+    return str(e)
+
+
+@app.post("/logga/bulk", dependencies=[Depends(verify_auth)])
+@app.post("/log/bulk",   dependencies=[Depends(verify_auth)])
+async def post_bulk(request: Request, wait: bool = False):
+    """Många måltider/pass i ett anrop. Ett snapshot per berört datum, efter sista batchen."""
+    results: List[Dict[str, Any]] = []
+    ops: List[Any] = []
+    dates: Set[str] = set()
+    untimed: List[Any] = []                                         # pass utan start_time
+    batch_dates: Set[str] = set()                                   # en dirty-markör per datum och batch
+
+    async def commit():
+        if not ops:
+            return
+        batch = _db().batch()
+        for ref, data, _ in ops:
+            batch.set(ref, data)
+        for d in batch_dates:
+            _mark_snapshot_dirty(batch, d)
         try:
-            m_ts = datetime.fromisoformat(st)
-            if m_ts.tzinfo is None:
-                m_ts = m_ts.replace(tzinfo=SE_TZ)
-        except Exception:
-            merged.append(m)
+            await run_in_threadpool(batch.commit)
+            for _, _, r in ops:
+                r["ok"] = True
+                dates.add(r["date"])
+        except Exception as e:
+            for _, _, r in ops:
+                r.update(ok=False, error=f"Firestore: {e}")
+                r.pop("id", None)
+        ops.clear()
+        batch_dates.clear()
+
+    async def add(i: int, kind: str, entry):
+        if kind == "meal":                                          # auto-id: samma datum/namn skriver inte över
+            ref, data = _store().meals.document(), entry.dict(exclude_none=True)
+        else:
+            ref, data = _store().workouts.document(), entry.dict(by_alias=True, exclude_none=True)
+        r = {"index": i, "ok": False, "kind": kind, "id": ref.id, "date": entry.date}
+        results.append(r)
+        ops.append((ref, data, r))
+        batch_dates.add(entry.date)
+        if len(ops) + len(batch_dates) >= BULK_BATCH_SIZE:
+            await commit()
+
+    async for i, raw in _bulk_items(request):
+        try:
+            kind, entry = _bulk_entry(raw)
+        except (ValueError, ValidationError) as e:
+            results.append({"index": i, "ok": False, "error": _bulk_error(e)})
+            continue
+        if kind == "workout" and not entry.start_time:
+            untimed.append((i, entry))
             continue
+        await add(i, kind, entry)
 
-        matched = False
-        for idx, a in enumerate(auto):
-            if idx in used:
-                continue
-            try:
-                a_ts = datetime.fromisoformat(a["originalStartTime"][:-6])
-                if a_ts.tzinfo is None:
-                    a_ts = a_ts.replace(tzinfo=SE_TZ)
-            except Exception:
-                continue
+    if untimed:                                                     # EN aktivitetshämtning för hela importen
+        days = sorted({e.date for _, e in untimed})
+        try:
+            auto = await _fitbit().activity_logs_range(days[0], days[-1])
+        except Exception as e:
+            print(f"⚠️ Aktivitetsloggar för bulk misslyckades: {type(e).__name__}: {e}")
+            auto = {}
+        used: Dict[str, Set[int]] = {}
+        for i, entry in untimed:
+            entry.start_time = _match_start_time(entry, auto.get(entry.date, []),
+                                                 used.setdefault(entry.date, set())) \
+                or f"{entry.date}T12:00:00"                         # okänd tid – mitt på dagen, inte nu
+            await add(i, "workout", entry)
+    await commit()
+    if not results:
+        raise HTTPException(400, "Inga poster i body.")
+    results.sort(key=lambda r: r["index"])
+
+    for d in sorted(dates):                                          # EN rebuild per datum
+        _cache_invalidate(d)
+        SNAPSHOT_WORKER.mark_dirty(user_key(d))
+    if wait:
+        await asyncio.gather(*(SNAPSHOT_WORKER.flush(user_key(d)) for d in dates))
+    inserted = sum(1 for r in results if r["ok"])
+    return {"ok": inserted == len(results), "inserted": inserted,
+            "failed": len(results) - inserted, "dates": sorted(dates), "results": results}
+
+# ─────────  Merge-pass  ─────────
+@timed("combine_workouts")
+async def _combine_workouts(d: str):
+    """Slår ihop manuella och Fitbit-pass + hanterar tidszon."""
+    manual_raw, auto_raw = await asyncio.gather(
+        _store().day("workouts", d), _fitbit_activity_logs(d)
+    )
+    return _merge_workouts(manual_raw, auto_raw)
 
-            if abs((a_ts - m_ts).total_seconds()) < 1800:
-                used.add(idx)
-                merged.append({**a, **m, "source": "merged"})
-                matched = True
-                break
-
-        if not matched:
-            merged.append(m)
-
-    # 2) manuella utan tid ⇒ heuristisk match
-    for m in [x for x in manual if not (x.get("start_time") or x.get("startTime"))]:
-        idx, conf = _guess_auto_match(m, auto, used)
-        if idx is not None and conf >= 0.8:
-            used.add(idx)
-            m["start_time"] = auto[idx]["originalStartTime"][:-6]
-            merged.append({**auto[idx], **m, "source": "merged"})
-        else:
-            merged.append({**m, "needs_confirmation": True})
 
-    # 3) lägg till ev. kvarvarande Fitbit-pass
-    merged.extend([a for i, a in enumerate(auto) if i not in used])
-    return merged
+@timed("merge_workouts")
+def _merge_workouts(manual_raw: List[Dict[str, Any]], auto_raw: List[Dict[str, Any]]):
+    """Ren merge-logik (ingen I/O) – se workout_merge.py."""
+    return merge_workouts(manual_raw, auto_raw, SE_TZ)
 
 
 # ─────────  Extract-helpers  ─────────
@@ -432,113 +912,261 @@ def _extract_kcal_out(blob):
         return None, True
 
 # ─────────  Fitbit wrapper  ─────────
-def _get_extended(d: str):
-    return {"steps": _fitbit_get("activities/steps", d, d),
-            "calories": _fitbit_get("activities/calories", d, d),
-            "sleep": _fitbit_get("sleep", d, d),
-            "heart": _fitbit_get("activities/heart", d, d),
-            "weight": _fitbit_get("body/log/weight", d, d),
-            "hrv": _fitbit_get("hrv", d, d)}
+async def _get_extended(d: str, keys=None):
+    """Resurserna parallellt – latens ≈ den långsammaste, inte summan."""
+    res = {k: EXTENDED_RESOURCES[k] for k in (keys or EXTENDED_RESOURCES)}
+    return await _fitbit().fetch_many(d, d, res)
+
+# ─────────  Projektion (view/fields)  ─────────
+SUMMARY_FIELDS = ("kcal_in", "kcal_out", "is_estimate", "sleep", "hrv",
+                  "meals", "workouts", "fitbit")
+VIEWS = {"full": frozenset(SUMMARY_FIELDS),
+         "compact": frozenset(SUMMARY_FIELDS) - {"fitbit"}}
+_SNAPSHOT_LIGHT = sorted(VIEWS["compact"] | set(SNAPSHOT_META))   # snapshot utan fitbit-blob
+
+# Vilka Fitbit-resurser varje fält kräver
+_FIELD_RESOURCES = {"kcal_out": {"calories"}, "is_estimate": {"calories"},
+                    "sleep": {"sleep"}, "hrv": {"hrv"},
+                    "fitbit": set(EXTENDED_RESOURCES)}
+
+
+def _parse_projection(view: str = "full", fields: Optional[str] = None) -> Optional[FrozenSet[str]]:
+    """view=compact|full eller fields=a,b,c → fältmängd; None = allt (full)."""
+    if fields:
+        want = frozenset(f.strip() for f in fields.split(",") if f.strip())
+        if bad := want - set(SUMMARY_FIELDS):
+            raise HTTPException(400, f"Okända fält: {', '.join(sorted(bad))}")
+    elif view in VIEWS:
+        want = VIEWS[view]
+    else:
+        raise HTTPException(400, f"Ogiltig view: {view} (compact|full)")
+    return None if want == VIEWS["full"] else want
+
+
+def _projection_key(fields: Optional[FrozenSet[str]]) -> str:
+    return "full" if fields is None else ",".join(sorted(fields))
+
+
+def _project(summary: Dict[str, Any], fields: Optional[FrozenSet[str]]) -> Dict[str, Any]:
+    if fields is None or "error" in summary:
+        return summary
+    return {k: v for k, v in summary.items()
+            if k in fields or k not in SUMMARY_FIELDS}   # date, fitbit_errors m.fl. följer med
+
+
+def _needed_resources(fields: FrozenSet[str]) -> List[str]:
+    need = set().union(*(_FIELD_RESOURCES.get(f, set()) for f in fields))
+    return [k for k in EXTENDED_RESOURCES if k in need]
+
+
+async def _const(v):
+    return v
 
 # ─────────  Daily summary  ─────────
-def _build_daily_summary(d: str):
-    meals = _fetch_meals(d)
-    workouts = _combine_workouts(d)
-    fb = _get_extended(d)
-    kcal_out, guess = _extract_kcal_out(fb.get("calories", {}))
-    return {"date": d,
-            "kcal_in": _sum_cals(meals),
-            "kcal_out": None if guess else kcal_out,
-            "is_estimate": guess,
-            "sleep": _extract_sleep(fb.get("sleep", {})),
-            "hrv": _extract_hrv(fb.get("hrv", {})),
-            "meals": meals,
-            "workouts": workouts,
-            "fitbit": fb}
-
-def _get_daily_summary(d: str, *, force_fresh=False):
+@timed("build_summary")
+async def _build_daily_summary(d: str, fields: Optional[FrozenSet[str]] = None):
+    """Bygger bara de sektioner som efterfrågas – och hämtar bara det de kräver."""
+    want = fields or VIEWS["full"]
+    res = _needed_resources(want)
+    meals, manual, auto, fb = await asyncio.gather(
+        _store().day("meals", d, None if "meals" in want else MEAL_KCAL_FIELDS)
+        if want & {"meals", "kcal_in"} else _const([]),
+        _store().day("workouts", d) if "workouts" in want else _const([]),
+        _fitbit_activity_logs(d) if "workouts" in want else _const([]),
+        _get_extended(d, res) if res else _const({}),
+    )
+    workouts = _merge_workouts(manual, auto) if "workouts" in want else []
+    return _assemble_summary(d, meals, workouts, fb, want)
+
+
+def _assemble_summary(d: str, meals, workouts, fb, want: FrozenSet[str] = VIEWS["full"]):
+    """Bygger summary-dict av redan hämtad data (delas av dag- och intervall-motorn)."""
+    out: Dict[str, Any] = {"date": d}
+    if "kcal_in" in want:
+        out["kcal_in"] = _sum_cals(meals)
+    if want & {"kcal_out", "is_estimate"}:
+        kcal_out, guess = _extract_kcal_out(fb.get("calories", {}))
+        if "kcal_out" in want:
+            out["kcal_out"] = None if guess else kcal_out
+        if "is_estimate" in want:
+            out["is_estimate"] = guess
+    if "sleep" in want:
+        out["sleep"] = _extract_sleep(fb.get("sleep", {}))
+    if "hrv" in want:
+        out["hrv"] = _extract_hrv(fb.get("hrv", {}))
+    if "meals" in want:
+        out["meals"] = meals
+    if "workouts" in want:
+        out["workouts"] = workouts
+    if "fitbit" in want:
+        out["fitbit"] = fb
+    if issues := [k for k, b in fb.items() if "error" in b or b.get("stale")]:
+        out["fitbit_errors"] = issues
+    return out
+
+async def _get_daily_summary(d: str, *, force_fresh=False,
+                             fields: Optional[FrozenSet[str]] = None):
     if not force_fresh and (c := _cache_get(d)):
-        return c
-    s = _build_daily_summary(d)
-    if not s["is_estimate"]:
+        return _project(c, fields)
+    s = await _build_daily_summary(d, fields)
+    if fields is None and not s["is_estimate"]:
         _cache_set(d, s)
     return s
 
+def _cacheable(summary: Dict[str, Any]) -> bool:
+    """Svar med Fitbit-fel/stale-data ska inte hamna i ETag-indexet."""
+    return "error" not in summary and not summary.get("fitbit_errors")
+
+# ─────────  Intervall-motor (flera dagar)  ─────────
+@timed("build_range")
+async def _build_range_summaries(start: str, end: str,
+                                 fields: Optional[FrozenSet[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Alla dagar i [start, end] med O(resurser) upstream-anrop i stället för O(dagar × resurser)."""
+    want = fields or VIEWS["full"]
+    res = _needed_resources(want)
+    meals, manual, auto, fb = await asyncio.gather(
+        _store().range("meals", start, end, None if "meals" in want else MEAL_KCAL_FIELDS)
+        if want & {"meals", "kcal_in"} else _const({}),
+        _store().range("workouts", start, end) if "workouts" in want else _const({}),
+        _fitbit().activity_logs_range(start, end) if "workouts" in want else _const({}),
+        _fitbit().fetch_range(start, end, {k: EXTENDED_RESOURCES[k] for k in res})
+        if res else _const({}),
+    )
+    # Alla dagars pass mergas i ett svep (gemensamt sorterat index)
+    workouts = merge_workouts_range(manual, auto, SE_TZ) if "workouts" in want else {}
+    out: Dict[str, Dict[str, Any]] = {}
+    for d in date_range(start, end):
+        try:
+            out[d] = _assemble_summary(d, meals.get(d, []), workouts.get(d, []),
+                                       fb.get(d, {}), want)
+        except Exception:
+            print(f"⚠️ Fel vid sammanställning för {d}:")
+            print(format_exc())
+            out[d] = {"error": f"Kunde inte hämta data för {d}."}
+    return out
+
+
+async def _get_range_summaries(dates: List[str], *, force_fresh=False,
+                               fields: Optional[FrozenSet[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Cache först, sedan ett enda intervall-bygge för de dagar som saknas."""
+    result: Dict[str, Dict[str, Any]] = {}
+    if not force_fresh:
+        result = {d: _project(c, fields) for d in dates if (c := _cache_get(d))}
+    missing = [d for d in dates if d not in result]
+    if missing:
+        built = await _build_range_summaries(min(missing), max(missing), fields)
+        for d in missing:
+            s = built[d]
+            result[d] = s
+            if fields is None and "error" not in s and not s["is_estimate"]:
+                _cache_set(d, s)
+    return {d: result[d] for d in dates}
+
 # ─────────  Summary-endpoints  ─────────
 @app.get("/sammanfatta")
 @app.get("/sammanfatta/{datum}")
 @app.get("/data/daily-summary")  # legacy
-def sammanfatta(datum: Optional[str] = None,
-                days_back: Optional[int] = None,
-                fresh: bool = False):
+async def sammanfatta(request: Request,
+                      datum: Optional[str] = None,
+                      days_back: Optional[int] = None,
+                      fresh: bool = False,
+                      view: str = "full",
+                      fields: Optional[str] = None):
     target = _resolve_date(datum, days_back=days_back)
-    return _get_daily_summary(target, force_fresh=fresh)
+    proj = _parse_projection(view, fields)
+    key = f"summary:{target}:{_projection_key(proj)}"
+    profile = None
+    if proj is None or "kcal_in" in proj:               # mål ur profilen (i minnet) – version i nyckeln
+        profile, version = await _tenant().profile.aget()
+        key += f":{version}"
+    if fresh:
+        _fitbit().cache.invalidate(target)
+    elif nm := ETAGS.not_modified(request, key):
+        return nm
+    s = await _get_daily_summary(target, force_fresh=fresh, fields=proj)
+    if profile and "error" not in s and (t := profile_targets(profile, s.get("kcal_in"))):
+        s = {**s, "targets": t}
+    return ETAGS.respond(request, key, s, [target], cacheable=_cacheable(s))
 
 @app.get("/daily-summary")  # ännu äldre alias
-def daily_summary_alias(date: Optional[str] = None,
-                        target_date: Optional[str] = None,
-                        fresh: bool = False):
-    return sammanfatta(datum=date or target_date, fresh=fresh)
+async def daily_summary_alias(request: Request,
+                              date: Optional[str] = None,
+                              target_date: Optional[str] = None,
+                              fresh: bool = False,
+                              view: str = "full",
+                              fields: Optional[str] = None):
+    return await sammanfatta(request, datum=date or target_date, fresh=fresh,
+                             view=view, fields=fields)
 
 # ─────────  Snapshot endpoint  🆕  ─────────
 @app.get("/v1/summaries/daily")
-def get_daily_snapshot(date: str, request: Request):
+async def get_daily_snapshot(date: str, request: Request, fresh: bool = False,
+                             view: str = "full", fields: Optional[str] = None):
     """Caching-säker daglig snapshot med ETag (löser midnatt-glömskan)."""
-    doc = SNAPSHOT_COL.document(date).get()
-    if not doc.exists:
-        # Skapa snapshot “on demand” första gången
-        _update_daily_snapshot(date)
-        doc = SNAPSHOT_COL.document(date).get()
-
-    data = doc.to_dict()
-    etag = data.get("updated_at")
-    if isinstance(etag, datetime):
-        etag = etag.isoformat()
-
-    if request.headers.get("if-none-match") == etag:
-        return Response(status_code=304)
-
-    return JSONResponse(content=data, headers={"ETag": etag})
+    proj = _parse_projection(view, fields)
+    key = f"snapshot:{date}:{_projection_key(proj)}"
+    if fresh:
+        _fitbit().cache.invalidate(date)                # annars byggs "fresh" av cachad Fitbit-data
+    elif nm := ETAGS.not_modified(request, key):
+        return nm
+    # Läs bara efterfrågade fält (slipper t.ex. hela fitbit-bloben)
+    paths = None if proj is None else \
+        sorted(proj | set(SNAPSHOT_META))
+    ref = _store().snapshots.document(date)
+    doc = await run_in_threadpool(ref.get, paths)
+    if fresh or not doc.exists or _snapshot_stale(doc.to_dict(), date):
+        # Skapa/bygg om snapshot “on demand” (saknas, inaktuell eller ?fresh=true)
+        await _update_daily_snapshot(date)
+        doc = await run_in_threadpool(ref.get, paths)
+
+    data = _project(_snapshot_public(doc.to_dict()), proj)      # utan updated_at/version/dirty
+    return ETAGS.respond(request, key, data, [date], cacheable=_cacheable(data))
 
 # ─────────  Fitbit-proxys  ─────────
+async def _proxy(request: Request, path: str, date: str):
+    key = f"proxy:{path}:{date}"
+    if nm := ETAGS.not_modified(request, key):
+        return nm
+    res = await _fitbit_get(path, date, date)
+    return ETAGS.respond(request, key, res, [date], cacheable="error" not in res)
+
 @app.get("/data/steps")
-def proxy_steps(date: str):    return _fitbit_get("activities/steps", date, date)
+async def proxy_steps(date: str, request: Request): return await _proxy(request, "activities/steps", date)
 
 @app.get("/data/sleep")
-def proxy_sleep(date: str):    return _fitbit_get("sleep", date, date)
+async def proxy_sleep(date: str, request: Request): return await _proxy(request, "sleep", date)
 
 @app.get("/data/heart")
-def proxy_heart(date: str):    return _fitbit_get("activities/heart", date, date)
+async def proxy_heart(date: str, request: Request): return await _proxy(request, "activities/heart", date)
 
 @app.get("/data/calories")
-def proxy_cal(date: str):      return _fitbit_get("activities/calories", date, date)
-
-from traceback import format_exc
-from fastapi import status
+async def proxy_cal(date: str, request: Request): return await _proxy(request, "activities/calories", date)
 
 @app.get("/data/extended/full")
-def extended_full(days: int = 1, fresh: bool = False):
+async def extended_full(request: Request, days: int = 1, fresh: bool = False,
+                        view: str = "full", fields: Optional[str] = None):
     if days < 1:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "days måste vara ≥ 1")
-    
+    if days > RANGE_MAX_DAYS:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST,
+                            f"Högst {RANGE_MAX_DAYS} dagar per anrop – använd /data/extended/stream")
+    proj = _parse_projection(view, fields)
+
     try:
         dates = [(_today_se() - timedelta(days=i)).isoformat() for i in reversed(range(days))]
-        result = {}
-
-        for d in dates:
-            try:
-                summary = _get_daily_summary(d, force_fresh=fresh)
-                result[d] = summary
-            except Exception as day_err:
-                print(f"⚠️ Fel vid sammanställning för {d}:")
-                print(format_exc())
-                result[d] = {"error": f"Kunde inte hämta data för {d}."}
-
-        return {
+        key = f"range:{dates[0]}:{dates[-1]}:{_projection_key(proj)}"
+        if fresh:
+            for d in dates:
+                _fitbit().cache.invalidate(d)
+        elif nm := ETAGS.not_modified(request, key):
+            return nm
+        result = await _get_range_summaries(dates, force_fresh=fresh, fields=proj)
+
+        return ETAGS.respond(request, key, {
             "from": dates[0],
             "to": dates[-1],
             "days": result
-        }
+        }, dates, cacheable=all(_cacheable(s) for s in result.values()))
 
     except Exception as e:
         print("❌ Allmänt fel i /data/extended/full:")
@@ -546,10 +1174,310 @@ def extended_full(days: int = 1, fresh: bool = False):
         raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Internt fel vid hämtning av dagsdata.")
 
+# ─────────  Snapshot-intervall (get_all + gap-fill)  ─────────
+def _read_snapshots(dates: List[str], paths: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    return _store().read_snapshots(dates, paths)
+
+
+def _write_snapshots_sync(summaries: Dict[str, Dict[str, Any]]):
+    items = list(summaries.items())
+    for i in range(0, len(items), BULK_BATCH_SIZE):
+        batch = _db().batch()
+        for d, s in items[i:i + BULK_BATCH_SIZE]:
+            batch.set(_store().snapshots.document(d), {**s, "snapshot_version": SNAPSHOT_VERSION,
+                                                 "updated_at": server_timestamp()})
+        batch.commit()
+
+
+async def _write_back_snapshots(summaries: Dict[str, Dict[str, Any]]):
+    if not summaries:
+        return
+    await run_in_threadpool(_write_snapshots_sync, summaries)
+    for d in summaries:
+        ETAGS.invalidate(d)
+    await _update_rollups(summaries)
+
+
+async def _snapshot_range(dates: List[str], proj: Optional[FrozenSet[str]] = None, *,
+                          fresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Alla datum med ETT get_all; saknade/inaktuella dagar byggs i ett intervall-svep
+    och skrivs tillbaka (bara felfria dagar – annars fastnar ett fel i en gammal dag)."""
+    paths = None if proj is None else \
+        sorted(proj | set(SNAPSHOT_META))
+    snaps = {} if fresh else await run_in_threadpool(_read_snapshots, dates, paths)
+    out = {d: _project(_snapshot_public(s), proj)
+           for d, s in snaps.items() if not _snapshot_stale(s, d)}
+    if missing := [d for d in dates if d not in out]:
+        built = await _build_range_summaries(min(missing), max(missing))   # fullt – för write-back
+        fill = {d: built[d] for d in missing}
+        await _write_back_snapshots({d: x for d, x in fill.items() if _cacheable(x)})
+        out.update({d: _project(x, proj) for d, x in fill.items()})
+    return {d: out[d] for d in dates}
+
+
+def _date_window(from_: Optional[str], to: Optional[str], days: int, max_days: int) -> List[str]:
+    end = _resolve_date(to)
+    start = _resolve_date(from_) if from_ else \
+        (dt_date.fromisoformat(end) - timedelta(days=max(days, 1) - 1)).isoformat()
+    if start > end:
+        raise HTTPException(400, "from måste vara ≤ to")
+    dates = date_range(start, end)
+    if len(dates) > max_days:
+        raise HTTPException(400, f"Högst {max_days} dagar per anrop")
+    return dates
+
+
+@app.get("/v1/summaries/range")
+async def get_summary_range(request: Request, from_: Optional[str] = Query(None, alias="from"),
+                            to: Optional[str] = None, days: int = 7, fresh: bool = False,
+                            view: str = "full", fields: Optional[str] = None):
+    """Flera dagar ur snapshot-samlingen; bara luckor räknas fram (och sparas)."""
+    proj = _parse_projection(view, fields)
+    dates = _date_window(from_, to, days, RANGE_MAX_DAYS)
+    key = f"snaprange:{dates[0]}:{dates[-1]}:{_projection_key(proj)}"
+    if fresh:
+        for d in dates:
+            _fitbit().cache.invalidate(d)
+    elif nm := ETAGS.not_modified(request, key):
+        return nm
+    result = await _snapshot_range(dates, proj, fresh=fresh)
+    return ETAGS.respond(request, key, {"from": dates[0], "to": dates[-1], "days": result},
+                         dates, cacheable=all(_cacheable(x) for x in result.values()))
+
+
+# ─────────  Trender (numpy över snapshots)  ─────────
+_TREND_FIELDS = frozenset({"kcal_in", "kcal_out", "sleep", "hrv"})
+# Beräknade svar per fönster; giltiga så länge ETAGS-posten (samma ETag) finns kvar –
+# den invalideras redan per datum vid skrivningar och går ut efter datumens ålder
+TRENDS_CACHE: LRUCache = LRUCache(maxsize=64)
+
+
+async def _trend_rows(dates: List[str]) -> Tuple[Dict[str, Dict[str, Any]], bool]:
+    """Råvärden per dag: snapshots (projicerade) + vilopuls ur Fitbits heart-serie.
+    Snapshots först ⇒ gap-fyllda dagar har redan heart i FitbitCache."""
+    summaries = await _snapshot_range(dates, _TREND_FIELDS)
+    heart = await _fitbit().fetch_range(dates[0], dates[-1], {"heart": EXTENDED_RESOURCES["heart"]})
+    rows = {d: trend_row(s, heart.get(d, {}).get("heart"))
+            for d, s in summaries.items() if "error" not in s}
+    complete = len(rows) == len(dates) and all(_cacheable(s) for s in summaries.values()) and \
+        not any("error" in (heart.get(d, {}).get("heart") or {}) for d in dates)
+    return rows, complete
+
+
+@app.get("/v1/trends")
+async def get_trends(request: Request, from_: Optional[str] = Query(None, alias="from"),
+                     to: Optional[str] = None, days: int = 28, window: int = 7,
+                     baseline: int = 28, metrics: Optional[str] = None):
+    """Glidande medel/median, energibalans och avvikelse från baslinjen för ett datumfönster."""
+    if not (2 <= window <= TRENDS_MAX_WINDOW and 7 <= baseline <= TRENDS_MAX_WINDOW):
+        raise HTTPException(400, f"window 2–{TRENDS_MAX_WINDOW}, baseline 7–{TRENDS_MAX_WINDOW}")
+    try:
+        want = parse_trend_metrics(metrics)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    dates = _date_window(from_, to, days, TRENDS_MAX_DAYS)
+    history = date_range(trend_first_date(dates[0], window, baseline), dates[-1])
+    key = f"trends:{dates[0]}:{dates[-1]}:{window}:{baseline}:{','.join(want)}"
+    if nm := ETAGS.not_modified(request, key):
+        return nm
+    hit, e = TRENDS_CACHE.get(user_key(key)), ETAGS.lookup(key)
+    if hit is not None and e is not None and hit[0] == e.etag:
+        res, complete = hit[1], True
+    else:
+        rows, complete = await _trend_rows(history)
+        with span("trends_compute"):
+            res = compute_trends(history, rows, start=dates[0], window=window,
+                                 baseline=baseline, metrics=want)
+    resp = ETAGS.respond(request, key, res, history, cacheable=complete)
+    if complete and (e := ETAGS.lookup(key)) is not None:
+        TRENDS_CACHE[user_key(key)] = (e.etag, res)
+    return resp
+
+
+def _read_rollups(period: str, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    refs = [_store().rollups.document(rollup_id(period, k)) for k in keys]
+    return {(x := s.to_dict())["key"]: x for s in _db().get_all(refs) if s.exists}
+
+
+async def _rebuild_rollup(period: str, key: str) -> Dict[str, Any]:
+    """Saknat/gammalt rollup-dokument: bygg från snapshots (med gap-fill) och spara."""
+    start, end = period_bounds(period, key)
+    end = min(end, _today_se().isoformat())
+    per_day: Dict[str, Dict[str, Any]] = {}
+    if start <= end:
+        summaries = await _snapshot_range(date_range(start, end))
+        per_day = {d: day_entry(x) for d, x in summaries.items() if "error" not in x}
+    doc = {**build_rollup(period, key, per_day), "filled_through": end}
+    if per_day:
+        await run_in_threadpool(_store().rollups.document(rollup_id(period, key)).set,
+                                {**doc, "updated_at": server_timestamp()})
+    return doc
+
+
+@app.get("/v1/summaries/rollups")
+async def get_rollups(request: Request, period: str = "week",
+                      from_: Optional[str] = Query(None, alias="from"), to: Optional[str] = None,
+                      days: int = 28, per_day: bool = False):
+    """Vecko-/månadssummor, snitt och trend – en läsning per period oavsett antal dagar."""
+    if period not in PERIODS:
+        raise HTTPException(400, f"Ogiltig period: {period} ({' | '.join(PERIODS)})")
+    dates = _date_window(from_, to, days, STREAM_MAX_DAYS)
+    keys = period_keys(period, dates[0], dates[-1])
+    covered = date_range(period_bounds(period, keys[0])[0], period_bounds(period, keys[-1])[1])
+    key = f"rollup:{period}:{keys[0]}:{keys[-1]}:{int(per_day)}"
+    if nm := ETAGS.not_modified(request, key):
+        return nm
+    docs = await run_in_threadpool(_read_rollups, period, keys)
+    today = _today_se().isoformat()
+    # Inkrementellt skapade dokument täcker bara dagar som haft snapshot ⇒ fyll luckor en gång
+    stale = [k for k in keys
+             if docs.get(k, {}).get("rollup_version") != ROLLUP_VERSION
+             or docs[k].get("filled_through", "") < min(period_bounds(period, k)[1], today)]
+    for k, doc in zip(stale, await asyncio.gather(*(_rebuild_rollup(period, k) for k in stale))):
+        docs[k] = doc
+    drop = {"updated_at", "rollup_version"} | (set() if per_day else {"per_day"})
+    out = [{f: v for f, v in docs[k].items() if f not in drop} for k in keys]
+    return ETAGS.respond(request, key, {"period": period, "rollups": out}, covered)
+
+# ─────────  NDJSON-ström (många dagar)  ─────────
+async def _summary_stream(dates: List[str], proj: Optional[FrozenSet[str]]):
+    """En rad per dag i datumordning; högst STREAM_LOOKAHEAD chunkar byggs före den som skrivs."""
+    chunks = iter([dates[i:i + STREAM_CHUNK_DAYS] for i in range(0, len(dates), STREAM_CHUNK_DAYS)])
+    pending: deque = deque()
+
+    def launch():
+        if (c := next(chunks, None)) is not None:
+            pending.append((c, asyncio.create_task(_snapshot_range(c, proj))))
+
+    try:
+        for _ in range(STREAM_LOOKAHEAD + 1):
+            launch()
+        while pending:
+            c, task = pending.popleft()
+            try:
+                res = await task
+            except Exception:
+                print(f"⚠️ Fel i ström-chunk {c[0]}–{c[-1]}:")
+                print(format_exc())
+                res = {}
+            launch()
+            for d in c:
+                yield render_json({"date": d, **res.get(d, {"error": f"Kunde inte hämta data för {d}."})}) + b"\n"
+    finally:
+        for _, task in pending:                       # klienten kopplade ner
+            task.cancel()
+
+
+@app.get("/data/extended/stream")
+async def extended_stream(from_: Optional[str] = Query(None, alias="from"), to: Optional[str] = None,
+                          days: int = 7, view: str = "full", fields: Optional[str] = None):
+    """NDJSON: en sammanfattning per rad så snart dagen är klar (låg minnestopp, snabb första byte)."""
+    _tenant()                                           # 401 före första byten – inte felrader i strömmen
+    proj = _parse_projection(view, fields)
+    dates = _date_window(from_, to, days, STREAM_MAX_DAYS)
+    return StreamingResponse(_summary_stream(dates, proj), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ─────────  Snapshot-kö  ─────────
+@app.get("/v1/snapshots/status", dependencies=[Depends(verify_auth)])
+def snapshot_status():
+    """Kö-djup, väntande datum och ålder på senast skrivna snapshots – bara den egna användarens."""
+    uid = _tenant().uid
+
+    def own(key: str) -> Optional[str]:
+        owner, d = split_user_key(key)
+        return d if owner == uid else None
+    return SNAPSHOT_WORKER.status(own)
+
 # ─────────  Healthcheck  ─────────
 @app.get("/health")
 def health():
-    return {"status": "ok", "time": datetime.now(SE_TZ).isoformat()}
+    """Flera användare: bara antal + den egna användarens token/kvot (om bearer anges)."""
+    out = {"status": "ok", "time": datetime.now(SE_TZ).isoformat(),
+           "firestore": DB.status(),
+           "prewarm": PREWARMER.status() if PREWARM_ENABLED else {"enabled": False}}
+    if TENANTS.multi:
+        out["users"] = len(TENANTS.configured())
+    if uid := current_user():
+        t = TENANTS.get(uid)
+        out["fitbit_token"] = t.tokens.status()
+        out["profile"] = t.profile.status()
+        if t.fitbit_client is not None:
+            out["fitbit_quota"] = t.fitbit_client.scheduler.status()
+            out["fitbit_cache"] = t.fitbit_client.cache.status()
+    return out
+
+# ─────────  Instrumentering (Server-Timing, /metrics, profiler)  ─────────
+try:                                    # pyinstrument är valfritt – utan den ignoreras debug-headern
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+HTTP_SECONDS = Histogram("http_request_seconds", "Svarstid per route", ["route", "method", "status"])
+
+def _fitbit_clients() -> List[FitbitClient]:
+    return [t.fitbit_client for t in TENANTS.loaded() if t.fitbit_client is not None]
+
+
+def _quota_spread(tokens: List[float]) -> Dict[Any, float]:
+    """Inga uid-etiketter – /metrics ska inte avslöja vilka användare som finns."""
+    return {("min",): min(tokens), ("max",): max(tokens)} if tokens else {}
+
+
+def _summed(stats: List[Dict[str, Any]]) -> Dict[Any, float]:
+    out: Dict[Any, float] = {}
+    for st in stats:
+        for k, v in st.items():
+            out[(k,)] = out.get((k,), 0) + v
+    return out
+
+
+CallbackMetric("fitbit_cache_events_total", "FitbitCache: träffar, missar, evictions", "counter", ["event"],
+               lambda: _summed([c.cache.stats for c in _fitbit_clients()]))
+CallbackMetric("fitbit_scheduler_events_total", "Schemaläggaren: anrop, coalescing, stale, 429", "counter",
+               ["event"], lambda: _summed([c.scheduler.stats for c in _fitbit_clients()]))
+CallbackMetric("fitbit_quota_tokens", "Kvar i Fitbit-kvoten (token bucket): lägsta/högsta bland användarna",
+               "gauge", ["stat"], lambda: _quota_spread([c.scheduler.status()["tokens"] for c in _fitbit_clients()]))
+CallbackMetric("http_conditional_total", "ETag-svar: 304 ur index/hash eller fullt svar", "counter",
+               ["result"], lambda: {(k,): v for k, v in ETAGS.stats.items()})
+CallbackMetric("snapshot_worker_events_total", "Write-behind: händelser, körningar, retries", "counter",
+               ["event"], lambda: {(k,): v for k, v in SNAPSHOT_WORKER.stats.items()})
+CallbackMetric("snapshot_queue_depth", "Datum som väntar på snapshot-uppdatering", "gauge", [],
+               lambda: {(): SNAPSHOT_WORKER.status()["queue_depth"]})
+
+
+@app.middleware("http")
+async def _instrument(request: Request, call_next):
+    """Spans per request → Server-Timing; svarstid → histogram; X-Debug-Profile ⇒ pyinstrument-HTML."""
+    tok, scope, user = begin_request(), begin_scope(), set_user(_request_user(request))
+    t0 = time.perf_counter()
+    profiler = None
+    if request.headers.get("x-debug-profile") and Profiler is not None and _authorized(request):
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        total = time.perf_counter() - t0
+        spans = end_request(tok)
+        end_scope(scope)
+        reset_user(user)
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_SECONDS.observe(total, route=route, method=request.method, status=status_code)
+        if profiler is not None:
+            profiler.stop()
+    if profiler is not None:
+        response = HTMLResponse(profiler.output_html())
+    response.headers["Server-Timing"] = server_timing(spans, total)
+    return response
+
+
+@app.get("/metrics", dependencies=[Depends(verify_auth)])
+def metrics():
+    """Prometheus-textformat."""
+    return Response(render_prometheus(), media_type="text/plain; version=0.0.4")
 
 # ─────────  Echo-diagnostik (matchar YAML /_echo)  ─────────
 @app.post("/_echo", dependencies=[Depends(verify_auth)])
@@ -0,0 +1,173 @@
+# 🏋️‍♂️ FitGPT – metrics.py
+# ────────────────────────────────────────────────────────────────────────────
+# Lättviktig instrumentering (inga extra beroenden):
+# • Counter / Histogram med etiketter + Prometheus-textformat för /metrics
+# • Callback-mätare som läses vid scrape (cache-statistik, Fitbit-kvot …)
+# • span()/timed(): tid per steg → histogram + per-request-summering
+#   (ContextVar ⇒ följer med in i asyncio-tasks och threadpool)
+# • server_timing(): Server-Timing-header av requestets spans
+
+from __future__ import annotations
+
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[str, ...]
+
+_REGISTRY: List[Any] = []
+_lock = threading.Lock()
+
+
+def _fmt_labels(names: Tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_num(v: float) -> str:
+    return "+Inf" if v == float("inf") else repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values: Dict[LabelKey, float] = {}
+        _REGISTRY.append(self)
+
+    def inc(self, n: float = 1.0, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + n
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for key, v in sorted(self._values.items()):
+                out.append(f"{self.name}{_fmt_labels(self.labels, key)} {_fmt_num(v)}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[LabelKey, List[float]] = {}      # [räknare per hink…, summa, antal]
+        _REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labels)
+        with _lock:
+            row = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for key, row in sorted(self._values.items()):
+                for b, c in zip(self.buckets, row):
+                    le = f'le="{_fmt_num(b)}"'
+                    out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {_fmt_num(c)}")
+                out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {row[-2]:.6f}")
+                out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {_fmt_num(row[-1])}")
+        return out
+
+
+class CallbackMetric:
+    """Värden som redan räknas någon annanstans (t.ex. cache.stats) – läses vid scrape."""
+
+    def __init__(self, name: str, doc: str, kind: str, labels: Iterable[str],
+                 fn: Callable[[], Dict[LabelKey, float]]):
+        self.name, self.doc, self.kind, self.labels, self._fn = name, doc, kind, tuple(labels), fn
+        _REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        try:
+            values = self._fn() or {}
+        except Exception:
+            return []
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for key, v in sorted(values.items()):
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                out.append(f"{self.name}{_fmt_labels(self.labels, key)} {_fmt_num(v)}")
+        return out
+
+
+def render_prometheus() -> str:
+    return "\n".join(line for m in _REGISTRY for line in m.render()) + "\n"
+
+
+# ─────────  Spans  ─────────
+STAGE_SECONDS = Histogram("fitgpt_stage_seconds", "Tid per steg (span)", ["stage"])
+
+_request_spans: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_spans", default=None)
+
+
+def begin_request() -> Any:
+    """Startar span-insamling för ett request; returnerar token till end_request()."""
+    return _request_spans.set({})
+
+
+def end_request(token: Any) -> Dict[str, List[float]]:
+    spans = _request_spans.get() or {}
+    _request_spans.reset(token)
+    return spans
+
+
+def record(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    spans = _request_spans.get()
+    if spans is not None:
+        with _lock:
+            row = spans.setdefault(stage, [0.0, 0])
+            row[0] += seconds
+            row[1] += 1
+
+
+@contextmanager
+def span(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t0)
+
+
+def timed(stage: str):
+    """Dekorator för sync- och async-funktioner."""
+    def deco(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*a, **kw):
+                with span(stage):
+                    return await fn(*a, **kw)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            with span(stage):
+                return fn(*a, **kw)
+        return wrapper
+    return deco
+
+
+def server_timing(spans: Dict[str, List[float]], total: Optional[float] = None) -> str:
+    """"fitbit;dur=120.5;desc="n=3", firestore_meals;dur=8.1, total;dur=131.0"."""
+    parts = [f'{name};dur={s * 1000:.1f};desc="n={n}"'
+             for name, (s, n) in sorted(spans.items(), key=lambda x: -x[1][0])]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
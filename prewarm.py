@@ -0,0 +1,111 @@
+# 🏋️‍♂️ FitGPT – prewarm.py
+# ────────────────────────────────────────────────────────────────────────────
+# Förvärmning av dags-snapshots (idag + igår) i bakgrunden:
+# • asyncio-loop som startas med appen – ingen extra beroende-schemaläggare
+# • Kör med jämn kadens OCH vid fasta klockslag (t.ex. strax efter midnatt och
+#   efter att Fitbit brukar ha synkat sömn/HRV); klockslag ⇒ "force"-körning
+# • Hoppar över en körning om Fitbit-kvoten är för låg (budget-callback)
+# • Status med senaste/nästa körning för /health
+
+from __future__ import annotations
+
+import asyncio
+import time
+from datetime import datetime, timedelta, tzinfo
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+JobFn = Callable[[bool], Awaitable[Any]]                 # job(force) → valfritt resultat
+
+
+def parse_times(spec: str) -> List[Tuple[int, int]]:
+    """"00:05,08:30" → [(0, 5), (8, 30)]."""
+    out = []
+    for part in (p.strip() for p in spec.split(",")):
+        if part:
+            h, m = part.split(":")
+            out.append((int(h), int(m)))
+    return sorted(out)
+
+
+class Prewarmer:
+    """Kör job(force) enligt kadens + klockslag i lokal tidszon."""
+
+    def __init__(self, job: JobFn, *, tz: tzinfo, interval: float = 3600.0,
+                 at: str = "00:05,08:30",
+                 budget_ok: Optional[Callable[[], bool]] = None):
+        self._job = job
+        self.tz = tz
+        self.interval = interval
+        self.at = parse_times(at)
+        self._budget_ok = budget_ok or (lambda: True)
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_result: Any = None
+        self.last_error: Optional[str] = None
+        self.next_run: Optional[datetime] = None
+        self.next_reason: Optional[str] = None
+        self.stats = {"runs": 0, "forced": 0, "skipped_budget": 0, "failures": 0}
+
+    # ── Livscykel ──
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    # ── Planering ──
+    def _next_clock(self, now: datetime) -> Optional[datetime]:
+        cands = [now.replace(hour=h, minute=m, second=0, microsecond=0) + timedelta(days=k)
+                 for k in (0, 1) for h, m in self.at]
+        future = [c for c in cands if c > now]
+        return min(future) if future else None
+
+    def _plan(self, now: datetime) -> Tuple[datetime, str]:
+        tick = now + timedelta(seconds=self.interval)
+        clock = self._next_clock(now)
+        if clock is not None and clock <= tick:
+            return clock, "schedule"
+        return tick, "interval"
+
+    async def run_once(self, force: bool = False) -> Any:
+        if not force and not self._budget_ok():
+            self.stats["skipped_budget"] += 1
+            self.last_result = "skipped: low Fitbit budget"
+            return None
+        t0 = time.perf_counter()
+        self.last_run = datetime.now(self.tz)
+        try:
+            self.last_result = await self._job(force)
+            self.last_error = None
+        except Exception as e:
+            self.stats["failures"] += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"⚠️ Prewarm misslyckades: {self.last_error}")
+        finally:
+            self.last_duration = round(time.perf_counter() - t0, 2)
+            self.stats["runs"] += 1
+            self.stats["forced"] += int(force)
+        return self.last_result
+
+    async def _loop(self):
+        reason = "startup"
+        while True:
+            await self.run_once(force=reason == "schedule")
+            now = datetime.now(self.tz)
+            self.next_run, self.next_reason = self._plan(now)
+            reason = self.next_reason
+            await asyncio.sleep(max(1.0, (self.next_run - now).total_seconds()))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "last_run": self.last_run.isoformat(timespec="seconds") if self.last_run else None,
+            "last_duration_s": self.last_duration,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "next_run": self.next_run.isoformat(timespec="seconds") if self.next_run else None,
+            "next_reason": self.next_reason,
+            **self.stats,
+        }
@@ -0,0 +1,180 @@
+# 🏋️‍♂️ FitGPT – profile_store.py
+# ────────────────────────────────────────────────────────────────────────────
+# Användarprofil med versionerad kopia i minnet:
+# • Version = innehålls-ETag (samma JSON ⇒ samma version, oavsett process)
+# • Läsningar ur minnet; efter max_age kontrolleras bara versionsfältet i Firestore
+# • Skrivningar: compare-and-swap mot If-Match i en Firestore-transaktion,
+#   lokal fil (default-användaren) skrivs atomiskt (temp-fil + os.replace)
+# • targets(): billiga mål (t.ex. kcal_target) till summary-bygget
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from firestore_client import server_timestamp, transactional
+from fitbit_token import write_json_atomic
+from http_cache import content_etag, etag_matches, render_json
+
+Profile = Dict[str, Any]
+
+KCAL_TARGET_KEYS = ("kcal_target", "target_kcal", "calorie_goal")   # första som finns gäller
+
+
+def profile_version(p: Profile) -> str:
+    return content_etag(render_json(p))
+
+
+def targets(p: Profile, kcal_in: Optional[float]) -> Optional[Dict[str, Any]]:
+    """Dagens mål ur profilen mot intaget, t.ex. {"kcal_target": 2200, "kcal_remaining": 400, …}."""
+    target = next((p[k] for k in KCAL_TARGET_KEYS
+                   if isinstance(p.get(k), (int, float)) and not isinstance(p.get(k), bool)), None)
+    if not target:
+        return None
+    out: Dict[str, Any] = {"kcal_target": target}
+    if kcal_in is not None:
+        out["kcal_remaining"] = target - kcal_in
+        out["kcal_pct"] = round(100 * kcal_in / target)
+    return out
+
+
+class VersionConflict(Exception):
+    """If-Match matchade inte lagrad version."""
+
+    def __init__(self, current: str):
+        super().__init__(f"Profilen har ändrats (aktuell version {current})")
+        self.current = current
+
+
+@transactional
+def _tx_put(tx, ref, profile: Profile, version: str, if_match: Optional[str], fallback: str) -> None:
+    """fallback: versionen om dokumentet saknar profil (tom, eller profilfilen före migrering)."""
+    snap = ref.get(["profile_version"], transaction=tx)
+    current = (snap.to_dict() or {}).get("profile_version") or fallback    # fältet kan saknas
+    if if_match is not None and not etag_matches(if_match, current):
+        raise VersionConflict(current)
+    tx.set(ref, {"profile": profile, "profile_version": version,
+                 "profile_updated_at": server_timestamp()},
+           merge=["profile", "profile_version", "profile_updated_at"])
+
+
+class ProfileStore:
+    """En användares profil. doc ⇒ Firestore (users/<uid>), path ⇒ lokal fil (kan kombineras)."""
+
+    def __init__(self, *, doc: Optional[Callable[[], Any]] = None,
+                 transaction: Optional[Callable[[], Any]] = None,
+                 path: Optional[str] = None, max_age: float = 30.0):
+        self._doc = doc
+        self._transaction = transaction
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._profile: Optional[Profile] = None
+        self._version = profile_version({})
+        self._checked = 0.0
+        self.stats = {"hits": 0, "loads": 0, "revalidated": 0, "writes": 0, "conflicts": 0}
+
+    # ── Läsning ──
+    def _fresh(self) -> bool:
+        return self._profile is not None and time.monotonic() - self._checked < self.max_age
+
+    def _read_file(self) -> Optional[Profile]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Kunde inte läsa profilfilen: {type(e).__name__}: {e}")
+            return None
+
+    def _set(self, p: Profile, version: Optional[str] = None):
+        self._profile = p
+        self._version = version or profile_version(p)
+        self._checked = time.monotonic()
+
+    def _load(self):
+        if self._doc is not None:
+            try:
+                # to_dict(): users/<uid> kan finnas utan profil (bara token) – .get(fält) ger KeyError
+                if self._profile is not None:              # bara versionen – hela profilen om den ändrats
+                    data = self._doc().get(["profile_version"]).to_dict() or {}
+                    if data.get("profile_version") == self._version:
+                        self._checked = time.monotonic()
+                        self.stats["revalidated"] += 1
+                        return
+                data = self._doc().get(["profile", "profile_version"]).to_dict() or {}
+                if data.get("profile") is not None:
+                    self.stats["loads"] += 1
+                    self._set(data["profile"], data.get("profile_version"))
+                    return
+            except Exception as e:
+                if not self.path:
+                    raise
+                print(f"⚠️ Profil ur Firestore misslyckades, använder filen: {type(e).__name__}: {e}")
+        self.stats["loads"] += 1
+        self._set(self._read_file() or {})             # fil (legacy/migrering) eller tom profil
+
+    def get(self) -> Tuple[Profile, str]:
+        """(profil, version). Blockerande vid (om)laddning – anropa via threadpool."""
+        if not self._fresh():
+            with self._lock:
+                if not self._fresh():
+                    self._load()
+        else:
+            self.stats["hits"] += 1
+        return copy.deepcopy(self._profile), self._version
+
+    async def aget(self) -> Tuple[Profile, str]:
+        """Snabbväg utan threadpool när kopian i minnet är färsk."""
+        if self._fresh():
+            self.stats["hits"] += 1
+            return copy.deepcopy(self._profile), self._version
+        return await asyncio.to_thread(self.get)
+
+    # ── Skrivning ──
+    def put(self, p: Profile, if_match: Optional[str] = None) -> str:
+        """Sparar hela profilen; if_match (ETag eller "*") ⇒ compare-and-swap. Returnerar ny version."""
+        version = profile_version(p)
+        with self._lock:
+            try:
+                if self._doc is not None:
+                    try:
+                        if self._profile is None:
+                            self._load()
+                        _tx_put(self._transaction(), self._doc(), p, version, if_match,
+                                self._version)
+                    except VersionConflict:
+                        raise
+                    except Exception as e:
+                        if not self.path:
+                            raise
+                        print(f"⚠️ Profil till Firestore misslyckades, bara filen: {type(e).__name__}: {e}")
+                        self._check_local(if_match)
+                else:
+                    self._check_local(if_match)
+            except VersionConflict:
+                self.stats["conflicts"] += 1
+                self._checked = 0.0                        # läs om vid nästa get()
+                raise
+            if self.path:
+                write_json_atomic(self.path, p)
+            self._set(copy.deepcopy(p), version)
+            self.stats["writes"] += 1
+        return version
+
+    def _check_local(self, if_match: Optional[str]):
+        if if_match is None:
+            return
+        if not self._fresh():
+            self._load()
+        if not etag_matches(if_match, self._version):
+            raise VersionConflict(self._version)
+
+    def status(self) -> Dict[str, Any]:
+        return {"loaded": self._profile is not None, "version": self._version, **self.stats}
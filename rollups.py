@@ -0,0 +1,103 @@
+# 🏋️‍♂️ FitGPT – rollups.py
+# ────────────────────────────────────────────────────────────────────────────
+# Vecko-/månadssammanställningar ovanpå dags-snapshots (ren logik, ingen I/O):
+# • Periodnycklar: ISO-vecka "2025-W27", månad "2025-07"
+# • Ett kompakt värde per dag sparas i rollup-dokumentet (per_day) ⇒ en
+#   ändrad dag uppdaterar summor/snitt/trend utan att läsa om perioden
+# • Trend = minsta-kvadrat-lutning per dag
+
+from __future__ import annotations
+
+from datetime import date as dt_date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+ROLLUP_VERSION = 2                                      # 2: 0 kcal_in = saknas
+PERIODS = ("week", "month")
+METRICS = ("kcal_in", "kcal_out", "balance", "sleep_min", "hrv", "workouts")
+
+
+def period_key(period: str, d: str) -> str:
+    x = dt_date.fromisoformat(d)
+    if period == "week":
+        y, w, _ = x.isocalendar()
+        return f"{y}-W{w:02d}"
+    if period == "month":
+        return d[:7]
+    raise ValueError(f"Okänd period: {period}")
+
+
+def period_bounds(period: str, key: str) -> Tuple[str, str]:
+    """Första och sista datum i perioden."""
+    if period == "week":
+        y, w = key.split("-W")
+        start = dt_date.fromisocalendar(int(y), int(w), 1)
+        return start.isoformat(), (start + timedelta(days=6)).isoformat()
+    if period == "month":
+        start = dt_date.fromisoformat(f"{key}-01")
+        nxt = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return start.isoformat(), (nxt - timedelta(days=1)).isoformat()
+    raise ValueError(f"Okänd period: {period}")
+
+
+def period_keys(period: str, start: str, end: str) -> List[str]:
+    """Alla periodnycklar som överlappar [start, end], i ordning."""
+    keys: List[str] = []
+    d = dt_date.fromisoformat(start)
+    stop = dt_date.fromisoformat(end)
+    while d <= stop:
+        k = period_key(period, d.isoformat())
+        keys.append(k)
+        d = dt_date.fromisoformat(period_bounds(period, k)[1]) + timedelta(days=1)
+    return keys
+
+
+def rollup_id(period: str, key: str) -> str:
+    return f"{period}-{key}"
+
+
+def day_entry(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Det lilla utdrag av en dags-summary som rollupen behöver.
+
+    0 kcal_in = inget loggat ⇒ saknas (räknas varken i intag eller balans).
+    """
+    kin, kout = summary.get("kcal_in") or None, summary.get("kcal_out")
+    sleep = summary.get("sleep") or {}
+    return {
+        "kcal_in": kin,
+        "kcal_out": kout,
+        "balance": kin - kout if kin is not None and kout is not None else None,
+        "sleep_min": sleep.get("minutes"),
+        "hrv": summary.get("hrv"),
+        "workouts": len(summary.get("workouts") or []),
+    }
+
+
+def _slope(points: List[Tuple[int, float]]) -> Optional[float]:
+    n = len(points)
+    if n < 2:
+        return None
+    mx = sum(x for x, _ in points) / n
+    my = sum(y for _, y in points) / n
+    den = sum((x - mx) ** 2 for x, _ in points)
+    return round(sum((x - mx) * (y - my) for x, y in points) / den, 3) if den else None
+
+
+def build_rollup(period: str, key: str, per_day: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Summor, snitt och trend (lutning/dag) för periodens dagar."""
+    start, end = period_bounds(period, key)
+    day0 = dt_date.fromisoformat(start)
+    sums: Dict[str, Any] = {}
+    avgs: Dict[str, Any] = {}
+    trend: Dict[str, Any] = {}
+    for m in METRICS:
+        pts = [((dt_date.fromisoformat(d) - day0).days, v[m])
+               for d, v in sorted(per_day.items()) if v.get(m) is not None]
+        vals = [v for _, v in pts]
+        sums[m] = sum(vals) if vals else None
+        avgs[m] = round(sum(vals) / len(vals), 1) if vals else None
+        trend[m] = _slope(pts)
+    return {
+        "period": period, "key": key, "start": start, "end": end,
+        "days": len(per_day), "sum": sums, "avg": avgs, "trend": trend,
+        "per_day": per_day, "rollup_version": ROLLUP_VERSION,
+    }
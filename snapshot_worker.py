@@ -0,0 +1,152 @@
+# 🏋️‍♂️ FitGPT – snapshot_worker.py
+# ────────────────────────────────────────────────────────────────────────────
+# Write-behind för dags-snapshots:
+# • Skriv-endpoints markerar "datum X är smutsigt" och svarar direkt
+# • Skurar mot samma datum (t.ex. fem måltidsrader) slås ihop till EN uppdatering
+#   efter ett debounce-fönster
+# • Begränsad samtidighet, aldrig två körningar för samma datum samtidigt
+# • Retry med exponentiell backoff; status för kö-djup och snapshot-ålder
+# • Kön finns bara i minnet: skrivningen sätter en dirty-räknare på snapshot-dokumentet
+#   (main.py) ⇒ en tappad körning (omstart, uttömda retries) byggs om vid nästa läsning
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+Event = Tuple[str, Any]                                   # ("meal", doc) | ("workout", None) | ("rebuild", None)
+ApplyFn = Callable[[str, List[Event]], Awaitable[Any]]
+
+
+class _Pending:
+    __slots__ = ("events", "first", "due", "attempts", "last_error")
+
+    def __init__(self, now: float, due: float):
+        self.events: List[Event] = []
+        self.first = now
+        self.due = due
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+
+
+class SnapshotWorker:
+    """Debouncad, per-datum kö som kör apply(date, events) i bakgrunden."""
+
+    def __init__(self, apply: ApplyFn, *, debounce: float = 2.0, concurrency: int = 2,
+                 max_retries: int = 4, backoff: float = 2.0):
+        self._apply = apply
+        self.debounce = debounce
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._sem = asyncio.Semaphore(concurrency)
+        self._pending: Dict[str, _Pending] = {}
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._written: Dict[str, float] = {}              # datum → senaste lyckade skrivning (epoch)
+        self._failed: Dict[str, str] = {}
+        self._wake = asyncio.Event()
+        self._loop_task: Optional[asyncio.Task] = None
+        self.stats = {"events": 0, "runs": 0, "retries": 0, "failures": 0}
+
+    # ── Livscykel ──
+    def start(self):
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._dispatch())
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Kör allt som väntar (utan debounce) och stäng sedan."""
+        for p in self._pending.values():
+            p.due = 0
+        self._wake.set()
+        deadline = time.monotonic() + drain_timeout
+        while (self._pending or self._running) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._loop_task:
+            self._loop_task.cancel()
+
+    # ── API ──
+    def mark_dirty(self, d: str, event: Event = ("rebuild", None)):
+        now = time.monotonic()
+        p = self._pending.get(d)
+        if p is None:
+            p = self._pending[d] = _Pending(now, now + self.debounce)
+        elif p.attempts == 0:
+            p.due = now + self.debounce                  # skjut fram – skuren pågår
+        p.events.append(event)
+        self.stats["events"] += 1
+        self._wake.set()
+
+    async def flush(self, d: str, timeout: float = 30.0):
+        """Kör datumets väntande händelser nu och vänta tills de är klara."""
+        if d in self._pending:
+            self._pending[d].due = 0
+            self._wake.set()
+        deadline = time.monotonic() + timeout
+        while (d in self._pending or d in self._running) and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+
+    def status(self, view: Optional[Callable[[str], Optional[str]]] = None) -> Dict[str, Any]:
+        """view(nyckel) → visad nyckel, eller None för att dölja posten (t.ex. annan användare)."""
+        view = view or (lambda k: k)
+        now_m, now = time.monotonic(), time.time()
+
+        def pick(items) -> List[Tuple[str, Any]]:
+            return sorted((v, x) for k, x in items if (v := view(k)) is not None)
+
+        pending = pick(self._pending.items())
+        return {
+            "queue_depth": len(pending),
+            "running": [v for v, _ in pick((k, None) for k in self._running)],
+            "pending": {d: {"events": len(p.events),
+                            "age_s": round(now_m - p.first, 1),
+                            "due_in_s": round(max(0.0, p.due - now_m), 1),
+                            "attempts": p.attempts,
+                            "last_error": p.last_error}
+                        for d, p in pending},
+            "snapshot_age_s": {d: round(now - t) for d, t in pick(self._written.items())[-14:]},
+            "failed": dict(pick(self._failed.items())),
+            **self.stats,
+        }
+
+    # ── Intern ──
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            for d in [d for d, p in self._pending.items() if p.due <= now and d not in self._running]:
+                p = self._pending.pop(d)
+                self._running.add(d)
+                t = asyncio.create_task(self._run(d, p))
+                self._tasks.add(t)
+                t.add_done_callback(self._tasks.discard)
+            waits = [p.due - now for d, p in self._pending.items() if d not in self._running]
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.01, min(waits)) if waits else None)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, d: str, p: _Pending):
+        try:
+            async with self._sem:
+                self.stats["runs"] += 1
+                await self._apply(d, p.events)
+            self._written[d] = time.time()
+            self._failed.pop(d, None)
+        except Exception as e:
+            p.attempts += 1
+            p.last_error = f"{type(e).__name__}: {e}"
+            print(f"⚠️ Snapshot {d} misslyckades (försök {p.attempts}): {p.last_error}")
+            if p.attempts > self.max_retries:
+                self.stats["failures"] += 1
+                self._failed[d] = p.last_error
+            else:
+                self.stats["retries"] += 1
+                p.due = time.monotonic() + self.backoff * 2 ** (p.attempts - 1)
+                newer = self._pending.pop(d, None)       # händelser som kom under körningen
+                if newer is not None:
+                    p.events += newer.events
+                self._pending[d] = p
+        finally:
+            self._running.discard(d)
+            self._wake.set()
@@ -0,0 +1,113 @@
+# 🏋️‍♂️ FitGPT – tenancy.py
+# ────────────────────────────────────────────────────────────────────────────
+# Flera användare i samma process:
+# • API_USERS mappar bearer-nyckel → användar-id; utan den körs allt som
+#   användaren "default" (som tidigare, en användare per deployment)
+# • Aktuell användare i en ContextVar (ärvs av asyncio-tasks och threadpool),
+#   sätts per request i middleware och med use_user() i bakgrundsjobb
+# • TenantRegistry skapar per-användar-resurser lazy (datastore, token, Fitbit-
+#   klient med egen kvot/cache) – connection-poolen delas
+# • user_key(): nyckel-prefix för cacher som delas mellan användare
+
+from __future__ import annotations
+
+import json
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+DEFAULT_USER = "default"                  # legacy-lagring: toppnivå-samlingar + token-fil
+USER_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_current: ContextVar[Optional[str]] = ContextVar("fitgpt_user", default=None)
+
+
+def parse_api_users(spec: Optional[str]) -> Dict[str, str]:
+    """API_USERS → {bearer-nyckel: användar-id}.
+
+    Antingen JSON-objekt {"nyckel": "id", …} eller "id:nyckel,id2:nyckel2".
+    """
+    if not spec or not spec.strip():
+        return {}
+    spec = spec.strip()
+    if spec.startswith("{"):
+        users = {str(k): str(v) for k, v in json.loads(spec).items()}
+    else:
+        users = {}
+        for part in (p.strip() for p in spec.split(",")):
+            if part:
+                uid, _, key = part.partition(":")
+                users[key.strip()] = uid.strip()
+    for key, uid in users.items():
+        if not key or not USER_ID_RE.match(uid):
+            raise ValueError(f"Ogiltig API_USERS-post för användare {uid!r}")
+    return users
+
+
+def current_user() -> Optional[str]:
+    return _current.get()
+
+
+def set_user(uid: Optional[str]) -> Any:
+    """För middleware: returnerar token till reset_user()."""
+    return _current.set(uid)
+
+
+def reset_user(token: Any):
+    _current.reset(token)
+
+
+@contextmanager
+def use_user(uid: str):
+    """Kör blocket som användaren uid (bakgrundsjobb, snapshot-worker, prewarm)."""
+    tok = _current.set(uid)
+    try:
+        yield
+    finally:
+        _current.reset(tok)
+
+
+def user_key(key: str, uid: Optional[str] = None) -> str:
+    """"2025-08-10" → "anna|2025-08-10" (default-användaren utan prefix)."""
+    uid = uid or _current.get() or DEFAULT_USER
+    return key if uid == DEFAULT_USER else f"{uid}|{key}"
+
+
+def split_user_key(key: str) -> tuple:
+    uid, sep, rest = key.partition("|")
+    return (uid, rest) if sep else (DEFAULT_USER, key)
+
+
+class TenantRegistry:
+    """uid → resurser, skapade en gång per process av factory(uid)."""
+
+    def __init__(self, factory: Callable[[str], Any], users: Optional[Dict[str, str]] = None):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._tenants: Dict[str, Any] = {}
+        self.keys: Dict[str, str] = dict(users or {})
+
+    @property
+    def multi(self) -> bool:
+        return bool(self.keys)
+
+    def configured(self) -> List[str]:
+        return sorted(set(self.keys.values())) if self.multi else [DEFAULT_USER]
+
+    def identify(self, bearer: Optional[str]) -> Optional[str]:
+        """Bearer-nyckel → uid (None = okänd). Bara i fleranvändarläge."""
+        return self.keys.get(bearer) if bearer else None
+
+    def get(self, uid: str) -> Any:
+        t = self._tenants.get(uid)
+        if t is None:
+            with self._lock:
+                t = self._tenants.get(uid)
+                if t is None:
+                    t = self._tenants[uid] = self._factory(uid)
+        return t
+
+    def loaded(self) -> Iterator[Any]:
+        return iter(list(self._tenants.values()))
@@ -0,0 +1,97 @@
+# 🏋️‍♂️ FitGPT – tools/check_scheduler.py
+# ────────────────────────────────────────────────────────────────────────────
+# Testharness för RateLimitScheduler mot lokal låtsas-Fitbit (tools/fake_fitbit.py).
+# Inga credentials behövs.  Kör:  python -m tools.check_scheduler
+
+from __future__ import annotations
+
+import asyncio
+import sys
+
+from fitbit_client import FitbitClient
+from fitbit_scheduler import BACKGROUND, INTERACTIVE, RateLimitScheduler, priority
+from tools.fake_fitbit import FakeFitbit
+
+TOKEN = {"access_token": "fake"}
+
+
+async def _token():
+    return TOKEN
+
+
+def _client(fake: FakeFitbit, **kw) -> FitbitClient:
+    return FitbitClient(_token, base_url=fake.base_url, scheduler=RateLimitScheduler(**kw))
+
+
+async def check_coalescing(fake: FakeFitbit):
+    fake.reset()
+    c = _client(fake, limit=fake.limit)
+    res = await asyncio.gather(*(c.get("activities/steps", "2025-08-01", "2025-08-01") for _ in range(10)))
+    await c.aclose()
+    assert all("data" in r for r in res), res
+    assert fake.calls["activities/steps"] == 1, fake.calls
+    assert c.scheduler.stats["coalesced"] == 9, c.scheduler.stats
+
+
+async def check_headers_and_stale(fake: FakeFitbit):
+    fake.reset()
+    c = _client(fake, limit=150, interactive_wait=0.2)   # klienten tror 150, servern har färre
+    first = await c.get("sleep", "2025-08-02", "2025-08-02")
+    assert "data" in first, first
+    assert c.scheduler.tokens <= fake.limit - 1, c.scheduler.status()   # synkat från headers
+    for i in range(fake.limit):
+        await c.get("activities/steps", f"2025-07-{1 + i % 28:02d}", f"2025-07-{1 + i % 28:02d}")
+    stale = await c.get("sleep", "2025-08-02", "2025-08-02")
+    assert stale.get("stale") is True and "data" in stale, stale
+    miss = await c.get("hrv", "2025-08-03", "2025-08-03")
+    assert miss.get("rate_limited") is True, miss
+    await c.aclose()
+
+
+async def check_429_no_sleep(fake: FakeFitbit):
+    fake.reset()
+    c = _client(fake, limit=150, interactive_wait=0.1)
+    fake._used = fake.limit                          # servern är redan slut
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    res = await c.get("activities/heart", "2025-08-04", "2025-08-04")
+    assert loop.time() - t0 < 1.0, "429 får inte sova i request-vägen"
+    assert res.get("rate_limited") and c.scheduler.stats["rate_limited"] == 1, res
+    await c.aclose()
+
+
+async def check_priority():
+    s = RateLimitScheduler(limit=3600, window=3600, reserve=0)
+    s.tokens = 0                                     # 1 token/s
+    order = []
+
+    async def job(tag):
+        order.append(tag)
+        return {"data": tag}
+
+    with priority(BACKGROUND):
+        bg = [asyncio.create_task(s.run(f"bg{i}", lambda i=i: job(f"bg{i}"))) for i in range(2)]
+    await asyncio.sleep(0)
+    fg = asyncio.create_task(s.run("fg", lambda: job("fg"), prio=INTERACTIVE))
+    await asyncio.gather(*bg, fg)
+    assert order[0] == "fg", order
+
+
+async def main() -> int:
+    failed = 0
+    with FakeFitbit(limit=20, latency=0.01) as fake:
+        for name, fn in [("coalescing", lambda: check_coalescing(fake)),
+                         ("headers+stale", lambda: check_headers_and_stale(fake)),
+                         ("429 utan sleep", lambda: check_429_no_sleep(fake)),
+                         ("prioritet", check_priority)]:
+            try:
+                await fn()
+                print(f"✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {name}: {e}")
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
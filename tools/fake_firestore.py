@@ -0,0 +1,276 @@
+# 🏋️‍♂️ FitGPT – tools/fake_firestore.py
+# ────────────────────────────────────────────────────────────────────────────
+# In-memory Firestore för benchmark/lokal körning (FITGPT_FIRESTORE=memory):
+# • Den delmängd av google-cloud-firestore som appen använder: collection/document,
+#   get (field_paths), set (merge), update, add, delete, where/select/order_by/limit/stream,
+#   get_all, WriteBatch och transaktioner som fungerar med @firestore.transactional
+# • SERVER_TIMESTAMP ersätts med aktuell UTC-tid, Increment adderas till befintligt värde
+# • Valfri latens per operation (simulerar nätverks-RTT) + räknare per operationstyp
+
+from __future__ import annotations
+
+import copy
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from google.cloud import firestore
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<":  lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">":  lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+def _resolve(data: Dict[str, Any], old: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    old = old or {}
+
+    def one(k: str, v: Any) -> Any:
+        if v is firestore.SERVER_TIMESTAMP:
+            return now
+        if isinstance(v, firestore.Increment):
+            return (old.get(k) or 0) + v.value
+        return v
+    return {k: one(k, v) for k, v in data.items()}
+
+
+class FakeSnapshot:
+    def __init__(self, ref: "FakeDocument", data: Optional[Dict[str, Any]],
+                 field_paths: Optional[Iterable[str]] = None):
+        self.reference = ref
+        self.id = ref.id
+        self.exists = data is not None
+        if data is not None and field_paths:
+            keep = set(field_paths)
+            data = {k: v for k, v in data.items() if k in keep}
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        """Som DocumentSnapshot.get: None om dokumentet saknas, KeyError om fältet saknas."""
+        if self._data is None:
+            return None
+        return copy.deepcopy(self._data[field])
+
+
+class FakeDocument:
+    def __init__(self, col: "FakeCollection", doc_id: str):
+        self._col = col
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._col.id}/{self.id}"
+
+    def get(self, field_paths: Optional[Iterable[str]] = None, transaction=None) -> FakeSnapshot:
+        self._col._db._op("read")
+        with self._col._db._lock:
+            return FakeSnapshot(self, self._col._docs.get(self.id), field_paths)
+
+    def _write(self, data: Dict[str, Any], merge: bool = False):
+        docs = self._col._docs
+        data = _resolve(data, docs.get(self.id) if merge else None)
+        if merge and self.id in docs:
+            docs[self.id].update(copy.deepcopy(data))
+        else:
+            docs[self.id] = copy.deepcopy(data)
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        self._col._db._op("write")
+        with self._col._db._lock:
+            self._write(data, merge)
+
+    def update(self, data: Dict[str, Any]):
+        self._col._db._op("write")
+        with self._col._db._lock:
+            if self.id not in self._col._docs:
+                raise KeyError(f"No document to update: {self.path}")
+            self._write(data, merge=True)
+
+    def delete(self):
+        self._col._db._op("write")
+        with self._col._db._lock:
+            self._col._docs.pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, col: "FakeCollection", filters=(), fields=None, order=None, limit=None):
+        self._col = col
+        self._filters: List[Tuple[str, str, Any]] = list(filters)
+        self._fields = fields
+        self._order = order
+        self._limit = limit
+
+    def _copy(self, **kw) -> "FakeQuery":
+        args = dict(filters=self._filters, fields=self._fields, order=self._order, limit=self._limit)
+        args.update(kw)
+        return FakeQuery(self._col, **args)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def select(self, field_paths: Iterable[str]) -> "FakeQuery":
+        return self._copy(fields=list(field_paths))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(order=(field_path, direction))
+
+    def limit(self, n: int) -> "FakeQuery":
+        return self._copy(limit=n)
+
+    def stream(self, transaction=None) -> Iterator[FakeSnapshot]:
+        db = self._col._db
+        db._op("query")
+        with db._lock:
+            rows = []
+            for doc_id, data in self._col._docs.items():
+                val = lambda f: doc_id if f == "__name__" else data.get(f)  # noqa: E731
+                if all(_OPS[op](val(f), v) for f, op, v in self._filters):
+                    rows.append((doc_id, data))
+            if self._order:
+                f, direction = self._order
+                rows.sort(key=lambda r: (r[1].get(f) is None, r[1].get(f)),
+                          reverse=direction == "DESCENDING")
+            if self._limit is not None:
+                rows = rows[:self._limit]
+            snaps = [FakeSnapshot(FakeDocument(self._col, i), d, self._fields) for i, d in rows]
+        db.stats["docs_read"] += len(snaps)
+        return iter(snaps)
+
+    def get(self, transaction=None) -> List[FakeSnapshot]:
+        return list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db: "FakeFirestore", name: str):
+        self._db = db
+        self.id = name
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        super().__init__(self)
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocument:
+        return FakeDocument(self, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        ref.set(data)
+        return datetime.now(timezone.utc), ref
+
+
+class FakeWriteBatch:
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._ops: List[Tuple[str, FakeDocument, Dict[str, Any], bool]] = []
+
+    def set(self, ref: FakeDocument, data: Dict[str, Any], merge: bool = False):
+        self._ops.append(("set", ref, data, merge))
+
+    def update(self, ref: FakeDocument, data: Dict[str, Any]):
+        self._ops.append(("update", ref, data, True))
+
+    def delete(self, ref: FakeDocument):
+        self._ops.append(("delete", ref, {}, False))
+
+    def _apply(self):
+        for kind, ref, data, merge in self._ops:
+            if kind == "delete":
+                ref._col._docs.pop(ref.id, None)
+            elif kind == "update" and ref.id not in ref._col._docs:
+                raise KeyError(f"No document to update: {ref.path}")
+            else:
+                ref._write(data, merge)
+        self._ops = []
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("A write batch can contain at most 500 operations.")
+        self._db._op("commit")
+        with self._db._lock:
+            self._apply()
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Seriell transaktion: låset hålls från _begin till _commit/_rollback."""
+
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, db: "FakeFirestore"):
+        super().__init__(db)
+        self._id: Optional[bytes] = None
+
+    def _clean_up(self):
+        self._ops = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._db._tx_lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self):
+        try:
+            self._db._op("commit")
+            with self._db._lock:
+                self._apply()
+        finally:
+            self._clean_up()
+            self._db._tx_lock.release()
+
+    def _rollback(self):
+        if self._id is not None:
+            self._clean_up()
+            self._db._tx_lock.release()
+
+
+class FakeFirestore:
+    """Ersätter firestore.Client i processen."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._cols: Dict[str, FakeCollection] = {}
+        self._lock = threading.RLock()
+        self._tx_lock = threading.RLock()
+        self.stats: Counter = Counter()
+
+    def _op(self, kind: str):
+        self.stats[kind] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name: str) -> FakeCollection:
+        with self._lock:
+            if name not in self._cols:
+                self._cols[name] = FakeCollection(self, name)
+            return self._cols[name]
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def get_all(self, references: Iterable[FakeDocument], field_paths=None,
+                transaction=None) -> Iterator[FakeSnapshot]:
+        refs = list(references)
+        self._op("read")
+        with self._lock:
+            snaps = [FakeSnapshot(r, r._col._docs.get(r.id), field_paths) for r in refs]
+        self.stats["docs_read"] += len(snaps)
+        return iter(snaps)
+
+    def reset_stats(self):
+        self.stats.clear()
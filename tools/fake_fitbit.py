@@ -0,0 +1,216 @@
+# 🏋️‍♂️ FitGPT – tools/fake_fitbit.py
+# ────────────────────────────────────────────────────────────────────────────
+# Lokal låtsas-Fitbit för tester/benchmarks utan riktiga credentials.
+# • Syntetiska tidsserier (steg, kalorier, puls, vikt, sömn, HRV) för valfritt intervall
+# • activities/list.json med afterDate/beforeDate/offset/limit + pagination.next
+# • Fitbit-Rate-Limit-*-headers, 429 när kvoten är slut (Retry-After = fönstrets rest),
+#   valfri 429-injektion (tillfällig strypning, Retry-After = 1 s)
+# • Konfigurerbar latens; anropsräknare på GET /_stats
+#
+# Kör:  python -m tools.fake_fitbit --port 8765 --latency 0.05 --limit 150
+# Peka sedan appen hit:  FITBIT_API_BASE=http://127.0.0.1:8765/1/user/-
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date as dt_date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+_RANGE = re.compile(r"^/1/user/-/(?P<res>.+)/date/(?P<start>\d{4}-\d\d-\d\d)/(?P<end>\d{4}-\d\d-\d\d)\.json$")
+
+
+def _days(start: str, end: str) -> List[str]:
+    s, e = dt_date.fromisoformat(start), dt_date.fromisoformat(end)
+    return [(s + timedelta(days=i)).isoformat() for i in range((e - s).days + 1)]
+
+
+def _seed(d: str) -> random.Random:
+    return random.Random(d)
+
+
+def timeseries(res: str, start: str, end: str) -> Dict[str, Any]:
+    """Deterministisk syntetisk data i samma form som Fitbits svar."""
+    days = _days(start, end)
+    if res == "activities/steps":
+        return {"activities-steps": [{"dateTime": d, "value": str(_seed(d).randint(3000, 15000))} for d in days]}
+    if res == "activities/calories":
+        return {"activities-calories": [{"dateTime": d, "value": str(_seed(d).randint(1900, 3200))} for d in days]}
+    if res == "activities/heart":
+        return {"activities-heart": [{"dateTime": d, "value": {"restingHeartRate": _seed(d).randint(48, 62),
+                                                               "heartRateZones": []}} for d in days]}
+    if res == "body/log/weight":
+        return {"weight": [{"date": d, "weight": round(80 + _seed(d).uniform(-1, 1), 1), "logId": i}
+                           for i, d in enumerate(days)]}
+    if res == "sleep":
+        return {"sleep": [{"dateOfSleep": d, "duration": _seed(d).randint(300, 540) * 60000,
+                           "efficiency": _seed(d).randint(80, 97)} for d in days]}
+    if res == "hrv":
+        return {"hrv": [{"dateTime": d, "value": {"dailyRmssd": 0, "rmssd": round(_seed(d).uniform(30, 70), 1)}}
+                        for d in days]}
+    return {}
+
+
+def activities_for(d: str, per_day: int) -> List[Dict[str, Any]]:
+    rnd = _seed("act" + d)
+    out = []
+    for i in range(per_day):
+        start = datetime.fromisoformat(d) + timedelta(hours=6 + i * 14 / max(per_day, 1), minutes=rnd.randint(0, 20))
+        out.append({"logId": int(start.timestamp()) * 100 + i,
+                    "activityName": rnd.choice(["Run", "Walk", "Weights", "Bike"]),
+                    "duration": rnd.randint(15, 90) * 60000,
+                    "calories": rnd.randint(80, 700),
+                    "originalStartTime": start.isoformat(timespec="milliseconds") + "+02:00"})
+    return out
+
+
+class FakeFitbit:
+    """Trådad HTTP-server. Används som context manager eller via start()/stop()."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, *,
+                 latency: float = 0.0, limit: int = 150, window: float = 3600.0,
+                 inject_429: float = 0.0, activities_per_day: int = 2):
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.inject_429 = inject_429
+        self.activities_per_day = activities_per_day
+        self.calls: Counter = Counter()
+        self._used = 0
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/1/user/-"
+
+    def start(self) -> "FakeFitbit":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    __enter__ = start
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self._used = 0
+            self._window_start = time.monotonic()
+
+    # ── Kvot ──
+    def _take(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.window:
+                self._window_start, self._used = now, 0
+            reset = max(0, int(self.window - (now - self._window_start)))
+            if self._used >= self.limit:
+                return False, 0, reset, max(reset, 1)
+            if random.random() < self.inject_429:
+                return False, self.limit - self._used, reset, 1
+            self._used += 1
+            return True, self.limit - self._used, reset, 0
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, body: Dict[str, Any], headers: Optional[Dict[str, Any]] = None):
+                raw = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, str(v))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self):
+                u = urlparse(self.path)
+                if u.path == "/_stats":
+                    return self._send(200, {"calls": dict(fake.calls), "total": sum(fake.calls.values())})
+                if fake.latency:
+                    time.sleep(fake.latency)
+                ok, remaining, reset, retry_after = fake._take()
+                rl = {"Fitbit-Rate-Limit-Limit": fake.limit,
+                      "Fitbit-Rate-Limit-Remaining": remaining,
+                      "Fitbit-Rate-Limit-Reset": reset}
+                if not ok:
+                    with fake._lock:
+                        fake.calls["429"] += 1
+                    return self._send(429, {"errors": [{"errorType": "request"}]},
+                                      {**rl, "Retry-After": retry_after})
+                if m := _RANGE.match(u.path):
+                    with fake._lock:
+                        fake.calls[m["res"]] += 1
+                    return self._send(200, timeseries(m["res"], m["start"], m["end"]), rl)
+                if u.path == "/1/user/-/activities/list.json":
+                    with fake._lock:
+                        fake.calls["activities/list"] += 1
+                    return self._send(200, fake._activity_page(parse_qs(u.query)), rl)
+                self._send(404, {"errors": [{"errorType": "not_found"}]}, rl)
+
+        return Handler
+
+    def _activity_page(self, q: Dict[str, List[str]]) -> Dict[str, Any]:
+        limit = min(int(q.get("limit", ["20"])[0]), 100)
+        offset = int(q.get("offset", ["0"])[0])
+        if "afterDate" in q:
+            start = dt_date.fromisoformat(q["afterDate"][0][:10])
+            days = [(start + timedelta(days=i)).isoformat() for i in range(60)]
+            days = [d for d in days if d <= dt_date.today().isoformat()]
+        else:
+            end = dt_date.fromisoformat(q["beforeDate"][0][:10])
+            days = [(end - timedelta(days=i)).isoformat() for i in range(60)]
+        acts = [a for d in days for a in activities_for(d, self.activities_per_day)]
+        if q.get("sort", ["asc"])[0] == "desc":
+            acts.sort(key=lambda a: a["originalStartTime"], reverse=True)
+        page = acts[offset:offset + limit]
+        nxt = ""
+        if offset + limit < len(acts):
+            qs = "&".join(f"{k}={v[0]}" for k, v in q.items() if k != "offset")
+            nxt = f"{self.base_url}/activities/list.json?{qs}&offset={offset + limit}"
+        return {"activities": page, "pagination": {"next": nxt, "offset": offset, "limit": limit}}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Lokal låtsas-Fitbit")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.0, help="sekunder per anrop")
+    ap.add_argument("--limit", type=int, default=150, help="anrop per fönster")
+    ap.add_argument("--window", type=float, default=3600.0, help="kvotfönster i sekunder")
+    ap.add_argument("--inject-429", type=float, default=0.0, help="andel slumpade 429:or")
+    a = ap.parse_args()
+    fake = FakeFitbit(a.host, a.port, latency=a.latency, limit=a.limit,
+                      window=a.window, inject_429=a.inject_429)
+    print(f"Fake Fitbit på {fake.base_url}")
+    try:
+        fake._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
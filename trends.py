@@ -0,0 +1,137 @@
+# 🏋️‍♂️ FitGPT – trends.py
+# ────────────────────────────────────────────────────────────────────────────
+# Härledda mått över ett datumfönster (ren logik, ingen I/O):
+# • En matris mått × dagar (NaN = saknas) ⇒ allt räknas i ett numpy-svep
+# • Glidande medel + median över `window` dagar (inklusive dagen själv)
+# • Energibalans = kcal_in − kcal_out per dag, summa/snitt/kumulativt över fönstret
+# • Baslinje = snitt/std för de `baseline` dagarna FÖRE dagen ⇒ avvikelse + z-värde
+# • Indata hämtas med extra historik före fönstret (lookback()) så att första
+#   dagen får fulla rullande värden
+
+from __future__ import annotations
+
+import warnings
+from datetime import date as dt_date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+METRICS = ("kcal_in", "kcal_out", "balance", "sleep_min", "hrv", "resting_hr")
+ROUNDING = {"z": 2}                                     # övriga serier: 1 decimal
+
+
+def lookback(window: int, baseline: int) -> int:
+    """Antal dagar före fönstret som behövs för rullande värden och baslinje."""
+    return max(window - 1, baseline)
+
+
+def first_date(start: str, window: int, baseline: int) -> str:
+    return (dt_date.fromisoformat(start) - timedelta(days=lookback(window, baseline))).isoformat()
+
+
+def parse_metrics(spec: Optional[str]) -> Tuple[str, ...]:
+    """"hrv,sleep_min" → ("sleep_min", "hrv") i METRICS-ordning; None = alla."""
+    if not spec:
+        return METRICS
+    want = {m.strip() for m in spec.split(",") if m.strip()}
+    if bad := want - set(METRICS):
+        raise ValueError(f"Okända mått: {', '.join(sorted(bad))}")
+    return tuple(m for m in METRICS if m in want)
+
+
+def resting_hr(blob: Dict[str, Any]) -> Optional[int]:
+    """Vilopuls ur ett activities/heart-svar (dags-form, {"data": {...}})."""
+    try:
+        series = (blob.get("data") or {}).get("activities-heart") or []
+        return int(series[0]["value"]["restingHeartRate"]) if series else None
+    except Exception:
+        return None
+
+
+def day_row(summary: Dict[str, Any], heart: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """En dags råvärden ur summary (+ heart-blob). 0 kcal_in = inget loggat ⇒ saknas."""
+    sleep = summary.get("sleep") or {}
+    return {
+        "kcal_in": summary.get("kcal_in") or None,
+        "kcal_out": summary.get("kcal_out"),
+        "sleep_min": sleep.get("minutes"),
+        "hrv": summary.get("hrv"),
+        "resting_hr": resting_hr(heart or {}),
+    }
+
+
+def _num(v: Any) -> float:
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+
+
+def _trailing(c: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """Summor över [lo, hi) ur kumulativ summa c (kolumn 0 = 0)."""
+    return c[:, hi] - c[:, lo]
+
+
+def _series(a: np.ndarray, key: str) -> List[Optional[float]]:
+    nd = ROUNDING.get(key, 1)
+    return [None if np.isnan(x) else round(float(x), nd) for x in a]
+
+
+def compute(dates: List[str], rows: Dict[str, Dict[str, Any]], *, start: str,
+            window: int = 7, baseline: int = 28,
+            metrics: Iterable[str] = METRICS) -> Dict[str, Any]:
+    """dates = hela indata-spannet (med lookback), rows = {datum: day_row()}.
+
+    Svaret gäller dagarna från start; serierna är kolumner i datumordning.
+    """
+    metrics = tuple(metrics)
+    n = len(dates)
+    raw = ("kcal_in", "kcal_out", "sleep_min", "hrv", "resting_hr")
+    x = np.array([[_num(rows.get(d, {}).get(m)) for d in dates] for m in raw]).reshape(len(raw), n)
+    x = np.vstack([x[:2], x[0] - x[1], x[2:]])            # balance (NaN om någon sida saknas)
+    x = x[[METRICS.index(m) for m in metrics]]
+
+    present = ~np.isnan(x)
+    zero = np.zeros((len(metrics), 1))
+    c_val = np.hstack([zero, np.cumsum(np.where(present, x, 0.0), axis=1)])
+    c_sq = np.hstack([zero, np.cumsum(np.where(present, x * x, 0.0), axis=1)])
+    c_cnt = np.hstack([zero, np.cumsum(present, axis=1)])
+    idx = np.arange(n)
+
+    # Glidande fönster [i-window+1, i]; kräver minst halva fönstret med data
+    lo = np.maximum(idx + 1 - window, 0)
+    cnt = _trailing(c_cnt, lo, idx + 1)
+    ok = cnt >= max(1, (window + 1) // 2)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # nanmedian över tomma fönster
+        mean = np.where(ok, _trailing(c_val, lo, idx + 1) / cnt, np.nan)
+        padded = np.hstack([np.full((len(metrics), window - 1), np.nan), x])
+        median = np.nanmedian(np.lib.stride_tricks.sliding_window_view(padded, window, axis=1), axis=2)
+        median = np.where(ok, median, np.nan)
+
+        # Baslinje [i-baseline, i-1]; kräver minst en fjärdedel (och 3 dagar)
+        blo = np.maximum(idx - baseline, 0)
+        bcnt = _trailing(c_cnt, blo, idx)
+        bok = bcnt >= max(3, baseline // 4)
+        bmean = np.where(bok, _trailing(c_val, blo, idx) / bcnt, np.nan)
+        bvar = (_trailing(c_sq, blo, idx) - bcnt * bmean ** 2) / (bcnt - 1)
+        bstd = np.sqrt(np.clip(bvar, 0.0, None))
+        dev = x - bmean
+        z = np.where(bstd > 0, dev / bstd, np.nan)
+
+    s = dates.index(start)
+    cols = {"value": x, "mean": mean, "median": median, "baseline": bmean, "deviation": dev, "z": z}
+    out_metrics = {m: {k: _series(a[i, s:], k) for k, a in cols.items()} for i, m in enumerate(metrics)}
+    latest = {m: {k: v[-1] for k, v in series.items()} for m, series in out_metrics.items()}
+
+    res: Dict[str, Any] = {
+        "from": start, "to": dates[-1], "window": window, "baseline_days": baseline,
+        "dates": dates[s:], "metrics": out_metrics, "latest": latest,
+    }
+    if "balance" in metrics:
+        bal = x[metrics.index("balance"), s:]
+        k = int((~np.isnan(bal)).sum())
+        res["energy_balance"] = {
+            "days": k,
+            "total": round(float(np.nansum(bal))) if k else None,
+            "avg_per_day": round(float(np.nanmean(bal)), 1) if k else None,
+            "cumulative": _series(np.where(np.isnan(bal), np.nan, np.nancumsum(bal)), "cumulative"),
+        }
+    return res
@@ -0,0 +1,307 @@
+# 🏋️‍♂️ FitGPT – workout_merge.py
+# ────────────────────────────────────────────────────────────────────────────
+# Merge av manuella pass mot Fitbit-aktiviteter:
+# • Tidsstämplar parsas EN gång per pass/aktivitet
+# • Aktiviteter sorteras på starttid; kandidater inom ±30 min via bisect
+#   (eller numpy.searchsorted för långa intervall-listor)
+# • Optimal 1-till-1-tilldelning i stället för first-fit – flest matchningar
+#   först, sedan minst total tidsdiff. På en tidslinje finns alltid en optimal
+#   icke-korsande lösning ⇒ bandad DP, O(pass × fönster). Heuristiken (pass utan
+#   tid) löses med ungersk metod per sammanhängande komponent.
+# • Samma utdataform och ordning som tidigare _combine_workouts
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_left, bisect_right
+from datetime import datetime, tzinfo
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+try:                                    # numpy är valfritt – bisect räcker för en dag
+    import numpy as np
+except ImportError:                     # pragma: no cover
+    np = None
+
+WINDOW_S = 1800                         # manuell start ±30 min mot Fitbit-start
+TIME_MATCH_CONF = 0.8                   # heuristisk match för pass utan tid
+VECTORIZE_MIN = 256                     # fler aktiviteter än så ⇒ numpy-väg
+_DAY_GAP = 1e10                         # håller dagar isär i den gemensamma tidsaxeln
+_BIG = 1e12
+
+_DUR_RE = re.compile(r"(\d+)\s*(?:min|\bmins?\b|\bm\b)")
+
+
+def extract_duration_min(t: str) -> Optional[int]:
+    m = _DUR_RE.search(t.lower()) if t else None
+    return int(m.group(1)) if m else None
+
+
+def _parse_start(s: Optional[str], tz: tzinfo) -> Optional[float]:
+    if not s:
+        return None
+    try:
+        ts = datetime.fromisoformat(s)
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=tz)
+        return ts.timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _manual_start(m: Dict[str, Any]) -> Optional[str]:
+    return m.get("start_time") or m.get("startTime")
+
+
+# ─────────  Heuristik (typ + längd)  ─────────
+def _features(a: Dict[str, Any]) -> Tuple[str, float]:
+    return a.get("activityName", "").lower(), a.get("duration", 0) / 60000
+
+
+def _score(wt_m: str, dur_m: Optional[int], name: str, dur_a: float) -> float:
+    score = 0.0
+    if wt_m and wt_m in name:
+        score += 0.6
+    elif name and name in wt_m:
+        score += 0.4
+    if dur_m is not None:
+        diff = abs(dur_a - dur_m) / max(dur_a, dur_m, 1)
+        score += 0.4 if diff <= 0.05 else 0.2 if diff <= 0.15 else 0.0
+    return score
+
+
+def guess_auto_match(m: Dict[str, Any], auto_logs: Sequence[Dict[str, Any]],
+                     used: Set[int]) -> Tuple[Optional[int], float]:
+    """Bästa Fitbit-aktivitet för ett manuellt pass utifrån typ och längd."""
+    dur_m = extract_duration_min(m.get("details", "")) or None
+    wt_m = m.get("type", "").lower()
+    best_idx, best_score = None, 0.0
+    for idx, a in enumerate(auto_logs):
+        if idx in used:
+            continue
+        score = _score(wt_m, dur_m, *_features(a))
+        if score > best_score:
+            best_idx, best_score = idx, score
+    return best_idx, best_score
+
+
+# ─────────  Optimal tilldelning  ─────────
+def _hungarian(cost: List[List[float]]) -> Dict[int, int]:
+    """Min-kostnad-tilldelning rad → kolumn för n ≤ m (O(n²m))."""
+    n, m = len(cost), len(cost[0])
+    inf = float("inf")
+    u, v = [0.0] * (n + 1), [0.0] * (m + 1)
+    p, way = [0] * (m + 1), [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0], j0 = i, 0
+        minv, used = [inf] * (m + 1), [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = p[j0], inf, 0
+            row = cost[i0 - 1]
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j], way[j] = cur, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    return {p[j] - 1: j - 1 for j in range(1, m + 1) if p[j]}
+
+
+def optimal_assign(edges: List[Tuple[int, int, float]]) -> Dict[int, int]:
+    """Vänster → höger för kanter (l, r, kostnad). Maximerar antal par, sedan min kostnad.
+
+    Grafen delas i sammanhängande komponenter så att varje ungersk körning blir liten.
+    """
+    parent: Dict[Tuple[str, int], Tuple[str, int]] = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for l, r, _ in edges:
+        parent[find(("l", l))] = find(("r", r))
+    comps: Dict[Tuple[str, int], List[Tuple[int, int, float]]] = {}
+    for e in edges:
+        comps.setdefault(find(("l", e[0])), []).append(e)
+
+    out: Dict[int, int] = {}
+    for comp in comps.values():
+        if len(comp) == 1:
+            out[comp[0][0]] = comp[0][1]
+            continue
+        ls = sorted({e[0] for e in comp})
+        rs = sorted({e[1] for e in comp})
+        li, ri = {x: k for k, x in enumerate(ls)}, {x: k for k, x in enumerate(rs)}
+        flip = len(ls) > len(rs)
+        rows, cols = (rs, ls) if flip else (ls, rs)
+        cost = [[_BIG] * len(cols) for _ in rows]
+        for l, r, c in comp:
+            if flip:
+                cost[ri[r]][li[l]] = c
+            else:
+                cost[li[l]][ri[r]] = c
+        for a, b in _hungarian(cost).items():
+            if cost[a][b] >= _BIG:
+                continue
+            l, r = (cols[b], rows[a]) if flip else (rows[a], cols[b])
+            out[l] = r
+    return out
+
+
+def _line_assign(m_keys: List[float], a_keys: List[float],
+                 cands: List[Tuple[int, int]]) -> Dict[int, int]:
+    """Optimal icke-korsande matchning manuell → aktivitet på den sorterade tidsaxeln.
+
+    m_keys och a_keys är sorterade; cands[i] = [lo, hi) med monotona gränser.
+    Position j i DP:n = "aktiviteter < j är förbrukade"; värde = (antal, -kostnad).
+    Positioner ≤ lo för aktuellt pass kan inte längre uppdateras ⇒ "frusna".
+    """
+    zero = ((0, 0.0), None)
+    stored: Dict[int, Tuple[Tuple[int, float], Any]] = {}
+    frozen, p = zero, 0
+
+    def best(a, b):
+        return b if b is not None and b[0] > a[0] else a
+
+    for i, (lo, hi) in enumerate(cands):
+        if lo >= hi:
+            continue
+        for k in range(p + 1, lo + 1):
+            frozen = best(frozen, stored.pop(k, None))
+        p = max(p, lo)
+        running, updates = frozen, []
+        for j in range(lo, hi):
+            if j > p:
+                running = best(running, stored.get(j))
+            (cnt, neg), node = running
+            updates.append((j + 1, ((cnt + 1, neg - abs(a_keys[j] - m_keys[i])), (i, j, node))))
+        for pos, val in updates:
+            stored[pos] = best(val, stored.get(pos)) if pos in stored else val
+
+    final = frozen
+    for v in stored.values():
+        final = best(final, v)
+    out: Dict[int, int] = {}
+    node = final[1]
+    while node is not None:
+        i, j, node = node
+        out[i] = j
+    return out
+
+
+def _window_candidates(m_keys: List[float], a_keys: List[float],
+                       vectorized: Optional[bool]) -> List[Tuple[int, int]]:
+    """[lo, hi) i den sorterade a_keys för varje manuell tid (|diff| < WINDOW_S)."""
+    if vectorized is None:
+        vectorized = np is not None and len(a_keys) >= VECTORIZE_MIN
+    if vectorized and np is not None:
+        a, m = np.asarray(a_keys), np.asarray(m_keys)
+        lo = np.searchsorted(a, m - WINDOW_S, side="right")
+        hi = np.searchsorted(a, m + WINDOW_S, side="left")
+        return list(zip(lo.tolist(), hi.tolist()))
+    return [(bisect_right(a_keys, t - WINDOW_S), bisect_left(a_keys, t + WINDOW_S))
+            for t in m_keys]
+
+
+# ─────────  Publikt API  ─────────
+def merge_workouts_range(manual_by_day: Dict[str, List[Dict[str, Any]]],
+                         auto_by_day: Dict[str, List[Dict[str, Any]]],
+                         tz: tzinfo, *,
+                         vectorized: Optional[bool] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Mergar många dagar i ett svep – en gemensam sorterad tidsaxel för alla aktiviteter.
+
+    Pass matchas bara mot aktiviteter samma dag (som förut).
+    """
+    days = sorted(set(manual_by_day) | set(auto_by_day))
+
+    # 1) parsa alla tider en gång, en gemensam sorterad tidsaxel
+    m_nodes: List[Tuple[float, int, int]] = []
+    a_nodes: List[Tuple[float, int, int]] = []
+    for di, d in enumerate(days):
+        base = di * _DAY_GAP
+        for i, m in enumerate(manual_by_day.get(d, [])):
+            t = _parse_start(_manual_start(m), tz)
+            if t is not None:
+                m_nodes.append((base + t, di, i))
+        for j, a in enumerate(auto_by_day.get(d, [])):
+            t = _parse_start(a.get("originalStartTime", "")[:-6], tz)
+            if t is not None:
+                a_nodes.append((base + t, di, j))
+    m_nodes.sort()
+    a_nodes.sort()
+    m_keys = [x[0] for x in m_nodes]
+    a_keys = [x[0] for x in a_nodes]
+
+    # 2) kandidater via sorterat index, sedan optimal tilldelning
+    cands = _window_candidates(m_keys, a_keys, vectorized)
+    timed: Dict[Tuple[int, int], int] = {
+        m_nodes[mi][1:]: a_nodes[aj][2] for mi, aj in _line_assign(m_keys, a_keys, cands).items()
+    }
+
+    # 3) bygg utdata per dag i samma ordning som tidigare
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for di, d in enumerate(days):
+        manual = [{**w, "source": "manual"} for w in manual_by_day.get(d, [])]
+        auto = [{**a, "source": "fitbit"} for a in auto_by_day.get(d, [])]
+        merged: List[Dict[str, Any]] = []
+        used: Set[int] = set()
+
+        for i, m in enumerate(manual):
+            if not _manual_start(m):
+                continue
+            j = timed.get((di, i))
+            if j is None:
+                merged.append(m)
+            else:
+                used.add(j)
+                merged.append({**auto[j], **m, "source": "merged"})
+
+        untimed = [m for m in manual if not _manual_start(m)]
+        if untimed:
+            feats = [_features(a) for a in auto]
+            score_edges = []
+            for i, m in enumerate(untimed):
+                dur_m = extract_duration_min(m.get("details", "")) or None
+                wt_m = m.get("type", "").lower()
+                for j, f in enumerate(feats):
+                    if j in used:
+                        continue
+                    s = _score(wt_m, dur_m, *f)
+                    if s >= TIME_MATCH_CONF:
+                        score_edges.append((i, j, 1.0 - s))
+            pairs = optimal_assign(score_edges)
+            for i, m in enumerate(untimed):
+                j = pairs.get(i)
+                if j is None:
+                    merged.append({**m, "needs_confirmation": True})
+                else:
+                    used.add(j)
+                    m["start_time"] = auto[j]["originalStartTime"][:-6]
+                    merged.append({**auto[j], **m, "source": "merged"})
+
+        merged.extend(a for j, a in enumerate(auto) if j not in used)
+        out[d] = merged
+    return out
+
+
+def merge_workouts(manual: List[Dict[str, Any]], auto: List[Dict[str, Any]],
+                   tz: tzinfo) -> List[Dict[str, Any]]:
+    """En dag: manuella pass mot dagens Fitbit-aktiviteter."""
+    return merge_workouts_range({"": manual}, {"": auto}, tz)[""]